@@ -31,4 +31,4 @@ echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
 echo "Starting Gunicorn..."
-gunicorn -c gunicorn.conf.py bot_constructor.wsgi:application
+gunicorn -c gunicorn.conf.py
@@ -0,0 +1,65 @@
+"""
+Нагрузочный тест API: выполняет запросы к адресу с заданной параллельностью
+в течение заданного времени и выводит пропускную способность и задержки.
+
+Сравнение профилей gunicorn (GUNICORN_PROFILE=sync и asgi):
+    python loadtest.py http://localhost:8000/health/ -c 50 -d 30
+    python loadtest.py http://localhost:8000/api/v1/bots/ -c 50 -d 30 --token <токен>
+"""
+
+import argparse
+import asyncio
+import time
+import httpx
+
+
+async def worker(client, url, deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            response = await client.get(url)
+            if response.status_code >= 400:
+                errors[response.status_code] = errors.get(response.status_code, 0) + 1
+        except httpx.HTTPError as e:
+            name = type(e).__name__
+            errors[name] = errors.get(name, 0) + 1
+        latencies.append(time.monotonic() - started)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    index = min(int(len(values) * percent / 100), len(values) - 1)
+    return values[index]
+
+
+async def run(url, concurrency, duration, token=None):
+    headers = {"Authorization": f"Token {token}"} if token else {}
+    limits = httpx.Limits(max_connections=concurrency)
+    latencies, errors = [], {}
+    async with httpx.AsyncClient(headers=headers, limits=limits, timeout=60) as client:
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(
+            *(worker(client, url, deadline, latencies, errors) for _ in range(concurrency))
+        )
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    print(f"URL:          {url}")
+    print(f"Параллельно:  {concurrency}, длительность {elapsed:.1f} с")
+    print(f"Запросов:     {len(latencies)} ({len(latencies) / elapsed:.1f} в секунду)")
+    print(f"Ошибок:       {sum(errors.values())} {errors or ''}")
+    for percent in (50, 95, 99):
+        print(f"p{percent}:          {percentile(latencies, percent) * 1000:.0f} мс")
+    print(f"max:          {(latencies[-1] if latencies else 0) * 1000:.0f} мс")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API")
+    parser.add_argument("url")
+    parser.add_argument("-c", "--concurrency", type=int, default=20)
+    parser.add_argument("-d", "--duration", type=float, default=10.0)
+    parser.add_argument("--token", help="токен DRF для авторизованных запросов")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.concurrency, args.duration, args.token))
@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class BotCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация списка ботов.
+    Стоимость запроса не зависит от номера страницы: следующая страница
+    выбирается по индексу от последней записи предыдущей.
+    """
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    ordering = ("-created_at", "-id")
+
+    @classmethod
+    def ordering_columns(cls):
+        """Колонки модели, по которым идет сортировка."""
+        return [name.lstrip("-") for name in cls.ordering]
@@ -0,0 +1,17 @@
+import json
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Рендерер для клиентов server-sent events (Accept: text/event-stream).
+    Сам поток отдается StreamingHttpResponse, через рендерер проходят только
+    ошибки, которые передаются клиенту событием error.
+    """
+
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f"event: error\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from bots.liveness import evaluate_heartbeat
 from bots.models import Bot, Scenario, Step
 import re
 
@@ -12,9 +13,13 @@ class BotControlSerializer(serializers.Serializer):
 
 
 class BotStatusSerializer(serializers.ModelSerializer):
-    """Сериализатор статуса бота"""
+    """
+    Сериализатор статуса бота.
+    Живость берется из словаря heartbeat-ов в контексте ("heartbeats": bot_id -> heartbeat).
+    """
 
     steps_count = serializers.SerializerMethodField()
+    liveness = serializers.SerializerMethodField()
 
     class Meta:
         model = Bot
@@ -28,15 +33,51 @@ class BotStatusSerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
             "steps_count",
+            "liveness",
         ]
 
     def get_steps_count(self, obj):
-        if not obj.current_scenario__id:
+        if not obj.current_scenario_id:
             return 0
-        return obj.objects.get_all_active_steps(obj.current_scenario__id).count()
+        return obj.current_scenario.active_steps_count
+
+    def get_liveness(self, obj):
+        heartbeats = self.context.get("heartbeats")
+        if heartbeats is None:
+            return None
+        return evaluate_heartbeat(obj.id, heartbeats.get(obj.id))
+
+
+class SparseFieldsMixin:
+    """
+    Позволяет выбрать поля ответа параметром запроса fields=id,name,...
+    Применяется только к GET-запросам, на неизвестные поля возвращается 400.
+    """
+
+    @staticmethod
+    def get_requested_fields(request):
+        """Множество запрошенных полей или None, если выбор полей не задан."""
+        if request is None or request.method != "GET":
+            return None
+        raw = request.query_params.get("fields")
+        if not raw:
+            return None
+        return {name.strip() for name in raw.split(",") if name.strip()}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.get_requested_fields(self.context.get("request"))
+        if requested:
+            unknown = requested - set(self.fields)
+            if unknown:
+                raise serializers.ValidationError(
+                    {"fields": f"Неизвестные поля: {', '.join(sorted(unknown))}"}
+                )
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
 
 
-class BotSerializer(serializers.ModelSerializer):
+class BotSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для Bot"""
 
     current_scenario = serializers.PrimaryKeyRelatedField(
@@ -55,6 +96,7 @@ class BotSerializer(serializers.ModelSerializer):
             "gpt_api_key",
             "gpt_api_url",
             "ai_model",
+            "ai_max_concurrency",
             "telegram_token",
             "current_scenario",
             "is_active",
@@ -150,6 +192,21 @@ class BotStepSerializer(serializers.ModelSerializer):
         return list(obj.scenario.bots.values_list("name", flat=True))
 
     def validate_handler_data(self, value):
+        stream = value.get("stream")
+        if stream is not None and not isinstance(stream, bool):
+            raise serializers.ValidationError("Параметр stream должен быть логическим")
+        summarize = value.get("summarize")
+        if summarize is not None and not isinstance(summarize, bool):
+            raise serializers.ValidationError("Параметр summarize должен быть логическим")
+        history_tokens = value.get("history_tokens")
+        if history_tokens is not None and (
+            not isinstance(history_tokens, int)
+            or isinstance(history_tokens, bool)
+            or history_tokens < 0
+        ):
+            raise serializers.ValidationError(
+                "Параметр history_tokens должен быть неотрицательным целым числом"
+            )
         filter_exp = value.get("filter_regex")
         if filter_exp:
             try:
@@ -169,4 +226,23 @@ class BotStepSerializer(serializers.ModelSerializer):
                 for button in row:
                     if not isinstance(button, str):
                         raise serializers.ValidationError("Неверный формат клавиатуры")
-        return value
\ No newline at end of file
+        return value
+
+class StepBulkListSerializer(serializers.ListSerializer):
+    """Список шагов для массового сохранения: id шагов не должны повторяться."""
+
+    def validate(self, attrs):
+        step_ids = [item["id"] for item in attrs if item.get("id")]
+        duplicates = sorted({i for i in step_ids if step_ids.count(i) > 1})
+        if duplicates:
+            raise serializers.ValidationError(f"Шаги {duplicates} указаны несколько раз")
+        return attrs
+
+
+class StepBulkSerializer(BotStepSerializer):
+    """Шаг в массовом сохранении: с id - обновление, без id - создание."""
+
+    id = serializers.IntegerField(required=False, min_value=1)
+
+    class Meta(BotStepSerializer.Meta):
+        list_serializer_class = StepBulkListSerializer
@@ -35,6 +35,9 @@ urlpatterns = [
         'post': 'create',
         'get': 'list'
     }), name='step-list'),
+    path('v1/scenarios/<int:scenario_id>/steps/bulk/', views.BotStepViewSet.as_view({
+        'post': 'bulk_upsert'
+    }), name='step-bulk'),
     path('v1/scenarios/<int:scenario_id>/steps/<int:pk>/', views.BotStepViewSet.as_view({
         'get': 'retrieve',
         'put': 'update',
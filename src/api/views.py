@@ -1,18 +1,30 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from bots.models import Bot, Scenario, Step
 from .serializers import (
     BotSerializer,
+    BotStatusSerializer,
     BotStepSerializer,
     BotControlSerializer,
+    StepBulkSerializer,
     ScenarioSerializer,
 )
+from .pagination import BotCursorPagination
+from .renderers import EventStreamRenderer
+from bots.events import format_event, get_last_event, stream_events
+from bots.liveness import read_heartbeats
 from bots.services import BotService
+from bots.scenario_cache import scenario_cache
 from bots.tasks import start_bot, stop_bot, restart_bot
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,13 +36,34 @@ class BotViewSet(viewsets.ModelViewSet):
     """
     queryset = Bot.objects.all().order_by('-created_at')
     serializer_class = BotSerializer
+    pagination_class = BotCursorPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    
+    # Колонки модели, из которых вычисляются поля сериализатора без source
+    computed_field_columns = {'status': ('is_running',)}
+
+    def get_read_columns(self):
+        """
+        Колонки, необходимые для ответа: поля сериализатора (с учетом fields=)
+        без write-only токена и ключа API, а также колонки сортировки.
+        """
+        columns = set(BotCursorPagination.ordering_columns())
+        for name, field in self.get_serializer().fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*':
+                columns.update(self.computed_field_columns.get(name, ()))
+            else:
+                columns.add(field.source)
+        return columns
+
     def get_queryset(self):
         """
-        Оптимизация queryset с prefetch_related для уменьшения количества запросов к БД
+        Для списка и просмотра загружаются только колонки, нужные для ответа:
+        зашифрованные токен и ключ API не читаются и не расшифровываются.
         """
-        return Bot.objects.get_all_bots_with_steps()
+        if self.action in ('list', 'retrieve'):
+            return Bot.objects.only(*self.get_read_columns())
+        return Bot.objects.select_related('current_scenario')
 
     
     @action(detail=True, methods=['post'])
@@ -162,20 +195,44 @@ class BotViewSet(viewsets.ModelViewSet):
         GET /api/bots/{id}/status/
         """
         bot = self.get_object()
-        
-        status_data = {
-            'id': bot.id,
-            'name': bot.name,
-            'is_active': bot.is_active,
-            'is_running': bot.is_running,
-            'last_started': bot.last_started,
-            'last_stopped': bot.last_stopped,
-            'created_at': bot.created_at,
-            'updated_at': bot.updated_at,
-            'steps_count': bot.current_scenario.steps.filter(is_active=True).count(),
-        }
-        
-        return Response(status_data)
+        serializer = BotStatusSerializer(
+            bot, context={'heartbeats': self._read_heartbeats([bot.id])}
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='batch/status')
+    def batch_status(self, request):
+        """
+        Статус нескольких ботов одним запросом
+        GET /api/v1/bots/batch/status/?ids=1,2,3
+        """
+        try:
+            ids = [int(i) for i in request.query_params.get('ids', '').split(',') if i]
+        except ValueError:
+            return Response(
+                {'error': 'ids должен быть списком id через запятую'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        control = BotControlSerializer(data={'bot_ids': ids})
+        control.is_valid(raise_exception=True)
+        bot_ids = control.validated_data['bot_ids']
+
+        bots = self.filter_queryset(
+            Bot.objects.select_related('current_scenario').filter(pk__in=bot_ids)
+        )
+        serializer = BotStatusSerializer(
+            bots, many=True, context={'heartbeats': self._read_heartbeats(bot_ids)}
+        )
+        return Response(serializer.data)
+
+    @staticmethod
+    def _read_heartbeats(bot_ids):
+        """Heartbeat-ы ботов или None, если Redis недоступен"""
+        try:
+            return read_heartbeats(bot_ids)
+        except Exception as e:
+            logger.error(f"Ошибка получения heartbeat ботов {bot_ids}: {e}")
+            return None
     
     @action(detail=True, methods=['get'])
     def task_status(self, request, pk=None):
@@ -202,6 +259,58 @@ class BotViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(
+        detail=True,
+        methods=['get'],
+        renderer_classes=[JSONRenderer, EventStreamRenderer],
+    )
+    def events(self, request, pk=None):
+        """
+        Поток событий жизненного цикла бота (server-sent events):
+        queued, initializing, polling, stopped, failed
+        GET /api/v1/bots/{id}/events/
+        При запуске через WSGI - короткий опрос: ответ с последним событием,
+        если оно новее ?since=<ts> (или заголовка Last-Event-ID), иначе 204.
+        """
+        bot = self.get_object()
+        if not isinstance(request._request, ASGIRequest):
+            return self._poll_event(request, bot)
+        response = StreamingHttpResponse(
+            stream_events(bot.id), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Отключает буферизацию ответа в nginx
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _poll_event(self, request, bot):
+        """
+        Короткий опрос события бота для WSGI-воркеров: ответ отдается сразу,
+        воркер не ждет новых событий. Клиенту server-sent events ответ
+        отдается с id и интервалом retry, и EventSource сам повторяет запрос.
+        """
+        since = request.query_params.get('since') or request.headers.get('Last-Event-ID')
+        try:
+            since = float(since) if since else None
+        except ValueError:
+            return Response(
+                {'error': 'Параметр since должен быть числом'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        event = get_last_event(bot.id, since)
+        if request.accepted_renderer.format != 'sse':
+            if event is None:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(event)
+        content = f"retry: {int(settings.BOT_EVENTS_POLL_INTERVAL * 1000)}\n"
+        if event is not None:
+            content += f"id: {event['ts']}\n" + format_event(json.dumps(event))
+        else:
+            content += "\n"
+        response = HttpResponse(content, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
     @action(detail=False, methods=['post'])
     def start_all(self, request):
         """
@@ -209,11 +318,12 @@ class BotViewSet(viewsets.ModelViewSet):
         POST /api/bots/start_all/
         """
         try:
-            result = BotService.start_all()
+            group_id, result = BotService.start_all()
             
             return Response({
                 'status': 'success',
                 'message': 'Задача запуска всех ботов отправлена',
+                'group_id': group_id,
                 'tasks': result
             })
             
@@ -231,11 +341,12 @@ class BotViewSet(viewsets.ModelViewSet):
         POST /api/bots/stop_all/
         """
         try:
-            result = BotService.stop_all()
+            group_id, result = BotService.stop_all()
             
             return Response({
                 'status': 'success',
                 'message': 'Задача остановки всех ботов отправлена',
+                'group_id': group_id,
                 'tasks': result
             })
             
@@ -246,30 +357,85 @@ class BotViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=['post'], url_path='batch/start')
+    def batch_start(self, request):
+        """
+        Запуск нескольких ботов
+        POST /api/v1/bots/batch/start/ {"bot_ids": [1, 2, 3]}
+        """
+        return self._batch_control(request, 'start')
+
+    @action(detail=False, methods=['post'], url_path='batch/stop')
+    def batch_stop(self, request):
+        """
+        Остановка нескольких ботов
+        POST /api/v1/bots/batch/stop/ {"bot_ids": [1, 2, 3]}
+        """
+        return self._batch_control(request, 'stop')
+
+    @action(detail=False, methods=['post'], url_path='batch/restart')
+    def batch_restart(self, request):
+        """
+        Перезапуск нескольких ботов
+        POST /api/v1/bots/batch/restart/ {"bot_ids": [1, 2, 3]}
+        """
+        return self._batch_control(request, 'restart')
+
+    @action(detail=False, methods=['get'], url_path=r'batch/(?P<group_id>[0-9a-f-]+)')
+    def batch_progress(self, request, group_id=None):
+        """
+        Ход выполнения массовой операции
+        GET /api/v1/bots/batch/{group_id}/
+        """
+        group_status = BotService.get_group_status(group_id)
+        if group_status is None:
+            return Response(
+                {'error': 'Группа задач не найдена'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(group_status)
+
+    def _batch_control(self, request, operation):
+        """
+        Проверяет права на ботов одним запросом и отправляет
+        задачи управления ими одной группой Celery
+        """
+        serializer = BotControlSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        bot_ids = list(dict.fromkeys(serializer.validated_data['bot_ids']))
+
+        bots = Bot.objects.filter(pk__in=bot_ids)
+        if not request.user.is_staff:
+            bots = bots.filter(owner=request.user)
+        found = set(bots.values_list('id', flat=True))
+        missing = [bot_id for bot_id in bot_ids if bot_id not in found]
+        if missing:
+            return Response(
+                {'error': f'Боты {missing} не найдены'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            group_id, tasks = BotService.control_bots(operation, bot_ids)
+        except Exception as e:
+            logger.error(f"Ошибка массовой операции {operation} для ботов {bot_ids}: {e}")
+            return Response(
+                {'error': f'Ошибка отправки задач: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response({
+            'status': 'success',
+            'group_id': group_id,
+            'tasks': tasks,
+        }, status=status.HTTP_202_ACCEPTED)
+
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """
         Статистика по ботам
         GET /api/bots/summary/
         """
-        total_bots = Bot.objects.count()
-        active_bots = Bot.objects.get_active_bots().count()
-        running_bots = Bot.objects.get_running_bots().count()
-        total_handlers = Step.objects.count()
-        active_handlers = Step.objects.filter(is_active=True).count()
-        
-        summary_data = {
-            'total_bots': total_bots,
-            'active_bots': active_bots,
-            'running_bots': running_bots,
-            'stopped_bots': active_bots - running_bots,
-            'inactive_bots': total_bots - active_bots,
-            'total_handlers': total_handlers,
-            'active_handlers': active_handlers,
-            'inactive_handlers': total_handlers - active_handlers
-        }
-        
-        return Response(summary_data)
+        return Response(BotService.get_summary())
 
 
 class ScenarioViewSet(viewsets.ModelViewSet):
@@ -369,18 +535,85 @@ class BotStepViewSet(viewsets.ModelViewSet):
             for bot in bots:
                 self._maybe_restart_bot(bot)
     
+    def bulk_upsert(self, request, scenario_id=None):
+        """
+        Массовое создание и обновление шагов сценария
+        POST /api/v1/scenarios/{scenario_id}/steps/bulk/
+        Принимает список шагов: шаги с id обновляются, без id - создаются.
+        """
+        scenario = self.get_scenario()
+        if not isinstance(request.data, list):
+            return Response(
+                {'error': 'Ожидается список шагов'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = StepBulkSerializer(
+            data=request.data, many=True, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+
+        step_ids = [data.pop('id', None) for data in serializer.validated_data]
+        existing = Step.objects.select_related('scenario').in_bulk(
+            [step_id for step_id in step_ids if step_id]
+        )
+        unknown = [
+            step_id for step_id in step_ids
+            if step_id and (step_id not in existing or existing[step_id].scenario_id != scenario.id)
+        ]
+        if unknown:
+            return Response(
+                {'error': f'Шаги {unknown} не найдены в сценарии'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        to_create, to_update, update_fields = [], [], set()
+        for step_id, data in zip(step_ids, serializer.validated_data):
+            if step_id:
+                step = existing[step_id]
+                for field, value in data.items():
+                    setattr(step, field, value)
+                update_fields.update(data)
+                to_update.append(step)
+            else:
+                to_create.append(Step(scenario=scenario, **data))
+
+        def on_commit():
+            # bulk-операции не отправляют сигналы моделей, поэтому кэши
+            # сбрасываются и боты перезагружаются здесь, после фиксации изменений
+            scenario_cache.invalidate(scenario.id)
+            BotService.invalidate_summary()
+            for bot in scenario.bots.all():
+                self._maybe_restart_bot(bot)
+
+        try:
+            with transaction.atomic():
+                if to_update:
+                    Step.objects.bulk_update(to_update, update_fields)
+                created = Step.objects.bulk_create(to_create)
+                Scenario.objects.refresh_active_steps_count(scenario.id)
+                transaction.on_commit(on_commit)
+        except IntegrityError as e:
+            logger.error(f"Ошибка массового сохранения шагов сценария {scenario.id}: {e}")
+            return Response(
+                {'error': 'Названия шагов в сценарии должны быть уникальными'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(
+            self.get_serializer(to_update + created, many=True).data,
+            status=status.HTTP_200_OK
+        )
+
     def _maybe_restart_bot(self, bot):
         """
-        Перезапуск бота если он запущен и активен
+        Горячая перезагрузка сценария бота, если он запущен и активен
         """
         if getattr(self, 'swagger_fake_view', False):
             return
         if bot.is_active and bot.is_running:
             try:
-                # Используем задержку чтобы избежать частых перезапусков
-                import time
-                time.sleep(1)
-                BotService.restart_bot(bot_id=bot.id)
-                logger.info(f"Запланирован перезапуск бота {bot.name} после изменения обработчиков")
+                # Серия изменений объединяется в одну перезагрузку
+                BotService.schedule_reload(bot_id=bot.id)
+                logger.info(f"Запланирована перезагрузка сценария бота {bot.name} после изменения обработчиков")
             except Exception as e:
                 logger.error(f"Ошибка планирования перезапуска бота {bot.id}: {e}")
@@ -15,6 +15,10 @@ app.conf.beat_schedule = {
         "task": "bots.tasks.check_bots_health",
         "schedule": 300.0,
     },
+    "supervise-bots": {
+        "task": "bots.tasks.supervise_bots",
+        "schedule": 5.0,
+    },
     "cleanup-old-tasks-every-hour": {
         "task": "bots.tasks.cleanup_old_tasks",
         "schedule": 3600.0,
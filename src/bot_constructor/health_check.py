@@ -1,6 +1,7 @@
 from django.http import JsonResponse
 from django.db import connection
 from redis import Redis
+from bots.redis_client import get_redis
 from redis.exceptions import ConnectionError as RedisConnectionError
 import logging
 
@@ -11,10 +12,11 @@ def health_check(request):
     checks = {
         "database": check_database(),
         "redis": check_redis(),
-        "overall": "healthy"
     }
-    
-    status_code = 200 if all(v == "healthy" for v in checks.values() if v != "overall") else 503
+    healthy = all(v == "healthy" for v in checks.values())
+    checks["overall"] = "healthy" if healthy else "unhealthy"
+
+    status_code = 200 if healthy else 503
     
     return JsonResponse(checks, status=status_code)
 
@@ -31,11 +33,7 @@ def check_database():
 def check_redis():
     """Проверка подключения к Redis"""
     try:
-        # Используйте ваш конфиг Redis из settings
-        from django.conf import settings
-        import redis
-        
-        redis_client = redis.from_url(settings.REDIS_URL)
+        redis_client = get_redis()
         redis_client.ping()
         return "healthy"
     except RedisConnectionError as e:
@@ -127,6 +127,19 @@ WSGI_APPLICATION = "bot_constructor.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Профиль запуска gunicorn (см. gunicorn.conf.py): sync или asgi
+GUNICORN_PROFILE = env("GUNICORN_PROFILE", default="sync")
+# Постоянные соединения с БД, сек. (0 - новое соединение на каждый запрос).
+# Под ASGI синхронные view выполняются в разных потоках, и постоянные соединения
+# копились бы по соединению на поток, поэтому для профиля asgi по умолчанию 0
+# (используйте пулер соединений, например pgbouncer)
+DB_CONN_MAX_AGE = env("DB_CONN_MAX_AGE", default="")
+DB_CONN_MAX_AGE = (
+    int(DB_CONN_MAX_AGE)
+    if DB_CONN_MAX_AGE
+    else (0 if GUNICORN_PROFILE == "asgi" else 60)
+)
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -135,6 +148,8 @@ DATABASES = {
         "PASSWORD": env("DB_PASSWORD", default="postgres"),
         "HOST": env("DB_HOST", default="localhost"),
         "PORT": env("DB_PORT", default="5432"),
+        "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
@@ -194,14 +209,50 @@ REST_FRAMEWORK = {
 }
 
 
-CELERY_BROKER_URL = env("REDIS_URL", default="redis://localhost:6379/0")
-CELERY_RESULT_BACKEND = env("REDIS_URL", default="redis://localhost:6379/0")
+REDIS_URL = env("REDIS_URL", default="redis://localhost:6379/0")
+# Общие пулы соединений с Redis в процессе (bots.redis_client): максимум соединений
+# синхронного пула и асинхронного пула одного event loop (каждый поток событий
+# бота держит свое соединение), время ожидания свободного соединения, сек.
+REDIS_MAX_CONNECTIONS = env.int("REDIS_MAX_CONNECTIONS", default=50)
+REDIS_ASYNC_MAX_CONNECTIONS = env.int("REDIS_ASYNC_MAX_CONNECTIONS", default=500)
+REDIS_POOL_TIMEOUT = env.float("REDIS_POOL_TIMEOUT", default=5.0)
+# Таймауты соединения и ответа Redis, сек. Таймаут ответа должен быть больше
+# времени блокирующих команд (BLPOP очереди webhook-обновлений - 5 с)
+REDIS_CONNECT_TIMEOUT = env.float("REDIS_CONNECT_TIMEOUT", default=2.0)
+REDIS_SOCKET_TIMEOUT = env.float("REDIS_SOCKET_TIMEOUT", default=10.0)
+# Проверка (PING) соединения, простаивавшего дольше, сек.
+REDIS_HEALTH_CHECK_INTERVAL = env.int("REDIS_HEALTH_CHECK_INTERVAL", default=30)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "bot_constructor",
+        # Кэш Django создает свой пул соединений, с теми же ограничениями,
+        # что и общие пулы bots.redis_client
+        "OPTIONS": {
+            "pool_class": "redis.BlockingConnectionPool",
+            "max_connections": REDIS_MAX_CONNECTIONS,
+            "timeout": REDIS_POOL_TIMEOUT,
+            "socket_timeout": REDIS_SOCKET_TIMEOUT,
+            "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+            "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+        },
+    }
+}
+# Время кэширования статистики по ботам (api/v1/bots/summary/), сек.; 0 - без кэша
+BOTS_SUMMARY_CACHE_TTL = env.int("BOTS_SUMMARY_CACHE_TTL", default=5)
+
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes
+# Результаты задач удаляются Redis автоматически через это время, сек.
+CELERY_RESULT_EXPIRES = env.int("CELERY_RESULT_EXPIRES", default=24 * 3600)
 
 AVAILABLE_GPT_API_URLS = [
     ("https://api.deepseek.com", "deepseek"),
@@ -268,8 +319,72 @@ LOGGING = {
     },
 }
 
+# Очистка результатов задач без срока жизни: возраст результата, после которого
+# он удаляется, сек., и количество ключей, обрабатываемых за один SCAN
+TASK_RESULTS_MAX_AGE = env.int("TASK_RESULTS_MAX_AGE", default=24 * 3600)
+TASK_RESULTS_CLEANUP_BATCH = env.int("TASK_RESULTS_CLEANUP_BATCH", default=500)
+
 # Для мониторинга ботов
 BOT_HEALTH_CHECK_INTERVAL = 300  # 5 minutes
+# Максимум одновременных запросов getMe при проверке здоровья ботов и их таймаут, сек.
+BOT_HEALTH_CHECK_CONCURRENCY = env.int("BOT_HEALTH_CHECK_CONCURRENCY", default=50)
+BOT_HEALTH_CHECK_TIMEOUT = env.float("BOT_HEALTH_CHECK_TIMEOUT", default=5.0)
+# Кэш расшифрованных секретов ботов в памяти процесса: время жизни, сек., и размер
+BOT_SECRETS_CACHE_TTL = env.int("BOT_SECRETS_CACHE_TTL", default=300)
+BOT_SECRETS_CACHE_SIZE = env.int("BOT_SECRETS_CACHE_SIZE", default=10000)
+# Интервал публикации heartbeat запущенным ботом, сек.
+BOT_HEARTBEAT_INTERVAL = env.float("BOT_HEARTBEAT_INTERVAL", default=10.0)
+# Бот считается зависшим, если цикл получения обновлений не завершался дольше, сек.
+BOT_POLL_STALL_TIMEOUT = env.float("BOT_POLL_STALL_TIMEOUT", default=60.0)
+# Интервал keepalive-комментариев в потоке событий бота (server-sent events), сек.
+BOT_EVENTS_KEEPALIVE = env.float("BOT_EVENTS_KEEPALIVE", default=15.0)
+# Интервал повторного запроса событий бота клиентами при запуске через WSGI, сек.
+BOT_EVENTS_POLL_INTERVAL = env.float("BOT_EVENTS_POLL_INTERVAL", default=2.0)
+
+# Режим хоста: боты воркера работают на общих event loop-ах, а не в потоке на бота
+BOT_HOST_MODE = env.bool("BOT_HOST_MODE", default=False)
+# Количество event loop-ов в режиме хоста (0 - по числу ядер)
+BOT_HOST_LOOPS = env.int("BOT_HOST_LOOPS", default=0)
+# Публичный адрес сервиса для приема обновлений Telegram через webhook
+# (например, https://example.com). Если не задан, боты используют long polling
+TELEGRAM_WEBHOOK_URL = env("TELEGRAM_WEBHOOK_URL", default="")
+# Минимальный интервал между правками сообщения при потоковой отправке ответа AI
+BOT_STREAM_EDIT_INTERVAL = env.float("BOT_STREAM_EDIT_INTERVAL", default=1.0)
+
+# История переписки с AI: хранилище и ограничения на один чат
+BOT_HISTORY_BACKEND = env(
+    "BOT_HISTORY_BACKEND", default="bots.history.RedisHistoryStore"
+)
+BOT_HISTORY_MAX_MESSAGES = env.int("BOT_HISTORY_MAX_MESSAGES", default=50)
+BOT_HISTORY_MAX_TOKENS = env.int("BOT_HISTORY_MAX_TOKENS", default=8000)
+BOT_HISTORY_TTL = env.int("BOT_HISTORY_TTL", default=7 * 24 * 3600)  # 7 days
+# Только для InMemoryHistoryStore: максимум чатов в памяти на одного бота
+BOT_HISTORY_MAX_CHATS = env.int("BOT_HISTORY_MAX_CHATS", default=10000)
+# Бюджет токенов истории в запросе к AI (переопределяется history_tokens шага)
+BOT_HISTORY_TOKEN_BUDGET = env.int("BOT_HISTORY_TOKEN_BUDGET", default=3000)
+
+# Время жизни скомпилированных сценариев в Redis, сек.
+SCENARIO_CACHE_TTL = env.int("SCENARIO_CACHE_TTL", default=24 * 3600)
+# Пауза после последнего изменения шагов перед перезагрузкой сценария ботов, сек.
+BOT_RELOAD_SETTLE_SECONDS = env.float("BOT_RELOAD_SETTLE_SECONDS", default=3.0)
+
+# Размещение ботов по воркерам: емкость воркера (вес в консистентном хэшировании),
+# количество виртуальных узлов на воркер, интервал heartbeat и время, после
+# которого воркер без heartbeat считается недоступным, сек.
+BOT_CLUSTER_CAPACITY = env.int("BOT_CLUSTER_CAPACITY", default=500)
+BOT_CLUSTER_VNODES = env.int("BOT_CLUSTER_VNODES", default=64)
+BOT_CLUSTER_HEARTBEAT_INTERVAL = env.float("BOT_CLUSTER_HEARTBEAT_INTERVAL", default=5.0)
+BOT_CLUSTER_WORKER_TTL = env.float("BOT_CLUSTER_WORKER_TTL", default=20.0)
+# Время, на которое запоминается результат проверки наличия живых воркеров, сек.
+BOT_WORKERS_CHECK_TTL = env.float("BOT_WORKERS_CHECK_TTL", default=5.0)
+# Время аренды бота воркером (продлевается heartbeat), сек.
+BOT_LEASE_TTL = env.int("BOT_LEASE_TTL", default=15)
+
+# Запуск ботов при старте воркера: количество одновременно запускаемых ботов,
+# максимум запусков в секунду (0 - без ограничения) и время ожидания запуска бота, сек.
+BOT_STARTUP_PARALLELISM = env.int("BOT_STARTUP_PARALLELISM", default=20)
+BOT_STARTUP_RATE = env.float("BOT_STARTUP_RATE", default=10.0)
+BOT_STARTUP_TIMEOUT = env.float("BOT_STARTUP_TIMEOUT", default=30.0)
 
 
 # Security settings for production
@@ -17,11 +17,17 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
+from bots import webhooks
 from . import health_check
 
 
 urlpatterns = [
     path("health/", health_check.health_check, name='health-check'),
+    path(
+        "telegram/webhook/<int:bot_id>/<str:path_token>/",
+        webhooks.telegram_webhook,
+        name="telegram-webhook",
+    ),
     path("admin/", admin.site.urls),
     path('api/', include('api.urls')),
     path('api-auth/', include('rest_framework.urls')),
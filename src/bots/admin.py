@@ -56,6 +56,7 @@ class BotAdmin(admin.ModelAdmin):
         "description",
         "gpt_api_url",
         "ai_model",
+        "ai_max_concurrency",
         "masked_gpt_api_key",
         "masked_telegram_token",
         "created_at",
@@ -116,7 +117,7 @@ class StepAdmin(admin.ModelAdmin):
 @admin.register(Scenario)
 class ScenarioAdmin(admin.ModelAdmin):
     form = ScenarioAdminForm
-    list_display = ("id", "title", "owner", "scenario_type")
+    list_display = ("id", "title", "owner", "scenario_type", "active_steps_count")
     readonly_fields = ("id", "steps_list", "add_step_button")
     list_display_links = ("title",)
     fields = ("title", "owner", "scenario_type", "steps_list", "add_step_button")
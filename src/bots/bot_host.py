@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import threading
+from django.conf import settings
+from .redis_client import close_async_redis
+
+
+logger = logging.getLogger(__name__)
+
+
+class BotHost:
+    """
+    Хост ботов: один поток с собственным event loop,
+    на котором одновременно работают приложения многих ботов.
+    Запуск и остановка ботов передаются в этот loop из других потоков.
+    """
+
+    def __init__(self, name: str):
+        """
+        :param name: имя хоста (используется в имени потока)
+        """
+        self.name = name
+        self.loop = None
+        self.bots_count = 0
+        self._thread = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def is_alive(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self):
+        """Запускает поток хоста и дожидается готовности event loop."""
+        with self._lock:
+            if self.is_alive:
+                return
+            self._ready.clear()
+            self._thread = threading.Thread(
+                target=self._run_loop, name=f"BotHost-{self.name}", daemon=True
+            )
+            self._thread.start()
+        self._ready.wait(timeout=5.0)
+
+    def _run_loop(self):
+        """Рабочая функция потока хоста."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        except Exception as e:
+            logger.error(f"Bot host {self.name} loop error: {e}", exc_info=True)
+        finally:
+            try:
+                self.loop.run_until_complete(close_async_redis())
+            except Exception as e:
+                logger.warning(f"Bot host {self.name} Redis pool close error: {e}")
+            self.loop.close()
+            self.loop = None
+
+    def submit(self, coro):
+        """
+        Планирует корутину в loop хоста.
+        :return: concurrent.futures.Future с результатом корутины
+        """
+        if not self.is_alive:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def acquire(self):
+        """Учитывает нового бота на хосте."""
+        with self._lock:
+            self.bots_count += 1
+
+    def release(self):
+        """Снимает бота с учета на хосте."""
+        with self._lock:
+            self.bots_count = max(self.bots_count - 1, 0)
+
+    def stop(self):
+        """Останавливает event loop хоста."""
+        if self.loop and self.is_alive:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5.0)
+
+
+class BotHostPool:
+    """
+    Набор хостов ботов. Новый бот размещается на наименее загруженном хосте.
+    """
+
+    def __init__(self, size: int):
+        """
+        :param size: количество хостов (event loop-ов)
+        """
+        self.hosts = [BotHost(str(i)) for i in range(max(size, 1))]
+        self._lock = threading.Lock()
+
+    def get_host(self) -> BotHost:
+        """
+        Возвращает наименее загруженный хост, запуская его при необходимости.
+        Место для бота резервируется сразу (acquire), чтобы одновременно
+        запускаемые боты распределялись по разным хостам. Резерв снимается
+        через release() при остановке бота или ошибке запуска.
+        """
+        with self._lock:
+            host = min(self.hosts, key=lambda h: h.bots_count)
+            host.acquire()
+        host.start()
+        return host
+
+    def stop(self):
+        """Останавливает все хосты."""
+        for host in self.hosts:
+            host.stop()
+
+
+_host_pool = None
+_host_pool_lock = threading.Lock()
+
+
+def get_bot_host():
+    """
+    Возвращает хост для нового бота, если включен режим общего event loop
+    (BOT_HOST_MODE), иначе None - бот работает в собственном потоке.
+    """
+    global _host_pool
+    if not settings.BOT_HOST_MODE:
+        return None
+    with _host_pool_lock:
+        if _host_pool is None:
+            size = settings.BOT_HOST_LOOPS or os.cpu_count() or 1
+            _host_pool = BotHostPool(size)
+            logger.info(f"Bot host pool created with {size} event loop(s)")
+    return _host_pool.get_host()
@@ -1,11 +1,22 @@
 import asyncio
+import concurrent.futures
 import logging
 import threading
-from telegram.ext import Application
+from telegram import Update
+from telegram.ext import Application, ConversationHandler, TypeHandler
+from django.conf import settings
 from django.utils import timezone
 from .models import Bot
-from openai import OpenAI
+from openai import AsyncOpenAI
 from .handlers import HandlerManager
+from .bot_host import BotHost, get_bot_host
+from .cluster import worker_registry
+from . import events
+from .history import get_history_store
+from .redis_client import close_async_redis
+from .secrets import secret_cache
+from .liveness import BotLiveness, LivenessRequest, publish_heartbeats
+from .webhooks import get_webhook_secret_token, get_webhook_url, webhook_dispatcher
 from asgiref.sync import sync_to_async
 
 
@@ -30,18 +41,47 @@ class DjangoBotRunner:
     Отвечает за инициализацию, запуск и остановку соответствующего Telegram-приложения.
     """
 
-    def __init__(self, bot_instance: Bot):
+    def __init__(self, bot_instance: Bot, host: BotHost = None):
         """
         :param bot_instance: объект бота из БД
+        :param host: хост с общим event loop; если не задан, бот работает в своем потоке
         """
         self.bot_instance = bot_instance
+        self.host = host
+        # Место на хосте уже зарезервировано при выборе хоста (BotHostPool.get_host)
+        self._host_reserved = host is not None
         self.application = None
         self.is_running = False
         self.loop = None
         self._polling_thread = None
-        self.history = dict()
+        self._polling_future = None
+        self._webhook_registered = False
+        self._heartbeat_task = None
+        self.liveness = None
+        self.history = None
         self.ai_client = None
         self.ai_model = None
+        self.ai_semaphore = None
+        self.converter = None
+        self.scenario_handlers = []
+        # False, если бот перенесен на другой воркер и статус в БД принадлежит ему
+        self.owns_status = True
+        # Устанавливается, когда бот начал получать обновления или не смог запуститься
+        self._ready = threading.Event()
+
+    def _build_handlers(self, scenario):
+        """
+        Строит хэндлеры сценария.
+        :return: (конвертер, список хэндлеров)
+        """
+        if not scenario:
+            raise HandlerInitException("Scenario not found")
+        handler_manager = HandlerManager()
+        handler_converter = handler_manager.get_converter(scenario)(scenario)
+        handlers = handler_converter.create_handlers(bot_runner=self)
+        if not handlers:
+            raise HandlerInitException("Error creating handlers (no one has created)")
+        return handler_converter, handlers
 
     def initialize(self) -> bool:
         """
@@ -51,35 +91,57 @@ class DjangoBotRunner:
         """
         try:
             self.ai_model = self.bot_instance.ai_model
-            self.ai_client = OpenAI(
-                api_key=self.bot_instance.gpt_api_key,
+            secrets = secret_cache.get(self.bot_instance)
+            self.history = get_history_store(self.bot_instance.id)
+            self.ai_client = AsyncOpenAI(
+                api_key=secrets.gpt_api_key,
                 base_url=self.bot_instance.gpt_api_url or None,
             )
+            # Ограничение одновременных запросов к AI со стороны одного бота
+            self.ai_semaphore = asyncio.Semaphore(
+                max(self.bot_instance.ai_max_concurrency, 1)
+            )
+            self.liveness = BotLiveness(self.bot_instance.id)
             self.application = (
-                Application.builder().token(self.bot_instance.telegram_token).build()
+                Application.builder()
+                .token(secrets.telegram_token)
+                .get_updates_request(
+                    LivenessRequest(self.liveness, connection_pool_size=1)
+                )
+                .build()
             )
+            # Служебные хэндлеры для heartbeat, не затрагиваются перезагрузкой сценария
+            self.application.add_handler(
+                TypeHandler(Update, self._on_update), group=-1
+            )
+            self.application.add_error_handler(self._on_error)
 
-            scenario = self.bot_instance.current_scenario
-
-            if scenario:
-                handler_manager = HandlerManager()
-                handler_converter = handler_manager.get_converter(scenario)(scenario)
-                handlers = handler_converter.create_handlers(bot_runner=self)
-                if not handlers:
-                    raise HandlerInitException(
-                        "Error creating handlers (no one has created)"
-                    )
-                for handler in handlers:
-                    self.application.add_handler(handler)
-            else:
-                raise HandlerInitException("Scenario not found")
+            self.converter, self.scenario_handlers = self._build_handlers(
+                self.bot_instance.current_scenario
+            )
+            for handler in self.scenario_handlers:
+                self.application.add_handler(handler)
             return True
         except Exception as e:
             logger.error(f"Error initializing bot {self.bot_instance.name}: {e}")
             return False
 
+    async def _on_update(self, update, context):
+        """Отмечает получение обновления для heartbeat."""
+        self.liveness.mark_update()
+
+    async def _on_error(self, update, context):
+        """Учитывает ошибку обработки обновления для heartbeat."""
+        self.liveness.mark_error()
+        logger.error(
+            f"Error handling update in bot {self.bot_instance.name}: {context.error}",
+            exc_info=context.error,
+        )
+
     def _save_status(self, is_running, last_started=None, last_stopped=None):
         """Сохранение статуса бота"""
+        if not self.owns_status:
+            return
         update_fields = ["is_running"]
         self.bot_instance.is_running = is_running
 
@@ -92,6 +154,11 @@ class DjangoBotRunner:
 
         self.bot_instance.save(update_fields=update_fields)
 
+    def _emit(self, state, **data):
+        """Публикует событие жизненного цикла бота, если бот принадлежит этому воркеру"""
+        if self.owns_status:
+            events.publish_event(self.bot_instance.id, state, **data)
+
     def _polling_worker(self):
         """
         Рабочая функция, которая запускается в отдельном потоке
@@ -108,24 +175,70 @@ class DjangoBotRunner:
             logger.error(f"Polling error in thread: {e}", exc_info=True)
         finally:
             if self.loop and not self.loop.is_closed():
+                try:
+                    self.loop.run_until_complete(close_async_redis())
+                except Exception as e:
+                    logger.warning(f"Could not close Redis connections: {e}")
                 self.loop.close()
             self.is_running = False
             self._save_status(False)
 
+    async def _run_hosted_polling(self):
+        """
+        Корутина, которая выполняется в общем event loop хоста ботов.
+        Аналог _polling_worker для режима хоста.
+        """
+        try:
+            await self._run_polling_async()
+        finally:
+            self.is_running = False
+            await sync_to_async(self._save_status)(False)
+
+    def _is_polling_alive(self) -> bool:
+        """Проверяет, работает ли еще polling предыдущего запуска."""
+        if self._polling_future is not None:
+            return not self._polling_future.done()
+        return bool(self._polling_thread and self._polling_thread.is_alive())
+
+    def _wait_polling(self, timeout: float):
+        """Ожидает завершения polling (потока или задачи на хосте)."""
+        if self._polling_future is not None:
+            concurrent.futures.wait([self._polling_future], timeout=timeout)
+        elif self._polling_thread:
+            self._polling_thread.join(timeout=timeout)
+
     async def _run_polling_async(self):
         """Асинхронный запуск polling с ручным управлением"""
+        error = None
         try:
-            if not self.application:
-                if not await sync_to_async(self.initialize)():
-                    logger.error("Failed to initialize application")
-                    return
             logger.info("Application initialization")
             await self.application.initialize()
 
             await self.application.start()
-            await self.application.updater.start_polling()
-
-            logger.info("Bot polling started")
+            self._heartbeat_task = asyncio.create_task(
+                publish_heartbeats(
+                    self.liveness, self.application, worker_registry.worker_id
+                )
+            )
+            if settings.TELEGRAM_WEBHOOK_URL:
+                # Обновления приходят на общий webhook и передаются через Redis
+                await self.application.bot.set_webhook(
+                    url=get_webhook_url(self.bot_instance.id),
+                    secret_token=get_webhook_secret_token(self.bot_instance.id),
+                    allowed_updates=Update.ALL_TYPES,
+                )
+                webhook_dispatcher.register(
+                    self.bot_instance.id,
+                    self.application,
+                    on_poll=self.liveness.mark_poll,
+                )
+                self._webhook_registered = True
+                logger.info("Bot webhook consumer started")
+            else:
+                await self.application.updater.start_polling()
+                logger.info("Bot polling started")
+            self._ready.set()
+            await sync_to_async(self._emit)(events.POLLING)
 
             while self.application.running:
                 await asyncio.sleep(1)
@@ -134,7 +247,28 @@ class DjangoBotRunner:
             logger.info("Bot polling cancelled")
         except Exception as e:
             logger.error(f"Polling error for bot {e}")
+            error = str(e)
         finally:
+            self._ready.set()
+            if self._webhook_registered:
+                webhook_dispatcher.unregister(self.bot_instance.id)
+                self._webhook_registered = False
+                if self.owns_status:
+                    # Бот остановлен: Telegram не должен присылать ему обновления.
+                    # Если бот перенесен на другой воркер, webhook нужен новой копии
+                    try:
+                        await asyncio.wait_for(
+                            self.application.bot.delete_webhook(), timeout=5.0
+                        )
+                    except Exception as e:
+                        logger.warning(f"Could not delete webhook: {e}")
+            # Отмененные задачи дожидаются, чтобы они не работали с уже
+            # закрытым application и loop
+            tasks = [task for task in (self._heartbeat_task,) if task]
+            self._heartbeat_task = None
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
             try:
                 if self.application:
                     if self.application.updater.running:
@@ -153,6 +287,10 @@ class DjangoBotRunner:
                     )
             except Exception as e:
                     logger.error(f"Error during shutdown: {e}")
+            if error:
+                await sync_to_async(self._emit)(events.FAILED, error=error)
+            else:
+                await sync_to_async(self._emit)(events.STOPPED)
 
     def start(self) -> bool:
         """
@@ -164,25 +302,51 @@ class DjangoBotRunner:
             self._save_status(True)
             return False
         
-        if self._polling_thread and self._polling_thread.is_alive():
+        if self._is_polling_alive():
             logger.warning("Previous bot instance is still stopping, waiting...")
-            self._polling_thread.join(timeout=3.0)
-            if self._polling_thread.is_alive():
+            self._wait_polling(timeout=3.0)
+            if self._is_polling_alive():
                 logger.error("Previous bot instance is still running, cannot start new one")
                 return False
         try:
             self.application = None
             self.loop = None
-            self._polling_thread = threading.Thread(
-                target=self._polling_worker,
-                name=f"BotPolling-{self.bot_instance.id}-{timezone.now().timestamp()}",
-                daemon=True,
-            )
-            self._polling_thread.start()
+            self._ready.clear()
+            self._emit(events.INITIALIZING)
+            # Приложение собирается в вызывающем потоке, а не через sync_to_async
+            # в loop бота: sync_to_async выполняет все вызовы в одном общем потоке,
+            # и при параллельном запуске ботов их сборка шла бы по очереди
+            if not self.initialize():
+                raise BotStartingError("Failed to initialize application")
+            if self.host:
+                self._polling_thread = None
+                if not self._host_reserved:
+                    self.host.acquire()
+                self._host_reserved = False
+                try:
+                    self._polling_future = self.host.submit(self._run_hosted_polling())
+                except Exception:
+                    self.host.release()
+                    raise
+                # Место освобождается по завершении бота, в том числе если задача
+                # отменена до начала выполнения
+                host = self.host
+                self._polling_future.add_done_callback(lambda _: host.release())
+                self.loop = self.host.loop
+                location = f"host {self.host.name}"
+            else:
+                self._polling_future = None
+                self._polling_thread = threading.Thread(
+                    target=self._polling_worker,
+                    name=f"BotPolling-{self.bot_instance.id}-{timezone.now().timestamp()}",
+                    daemon=True,
+                )
+                self._polling_thread.start()
+                location = f"thread {self._polling_thread.name}"
             self.is_running = True
             self._save_status(True, last_started=timezone.now())
             logger.info(
-                f"Bot {self.bot_instance.name} started successfully in thread {self._polling_thread.name}"
+                f"Bot {self.bot_instance.name} started successfully in {location}"
             )
             return True
 
@@ -190,8 +354,18 @@ class DjangoBotRunner:
             logger.error(f"Error starting bot {self.bot_instance.name}: {e}")
             self.is_running = False
             self._save_status(False)
+            self._emit(events.FAILED, error=str(e))
             return False
 
+    def wait_ready(self, timeout: float) -> bool:
+        """
+        Ожидает, пока запущенный бот начнет получать обновления.
+        :return: True если бот работает, False при ошибке запуска или по таймауту
+        """
+        self._ready.wait(timeout=timeout)
+        application = self.application
+        return self.is_running and bool(application and application.running)
+
     def stop(self) -> bool:
         """
         Останавливает работу Telegram-бота и записывает событие в БД.
@@ -212,15 +386,18 @@ class DjangoBotRunner:
                 logger.info("Application stopped via event loop")
             except Exception as e:
                 logger.warning(f"Could not stop via event loop: {e}")
-                if self.loop and self.loop.is_running:
+                if self._polling_future is not None:
+                    # Общий loop хоста останавливать нельзя - отменяем только задачу бота
+                    self._polling_future.cancel()
+                elif self.loop and self.loop.is_running():
                     self.loop.call_soon_threadsafe(self.loop.stop)
 
-            if self._polling_thread and self._polling_thread.is_alive():
-                self._polling_thread.join(timeout=5.0)
-                if self._polling_thread.is_alive():
-                    logger.warning("Polling thread still alive after timeout")
+            if self._is_polling_alive():
+                self._wait_polling(timeout=5.0)
+                if self._is_polling_alive():
+                    logger.warning("Polling still alive after timeout")
                 else:
-                    logger.info("Polling thread closed")
+                    logger.info("Polling closed")
 
             self.application = None
             self.loop = None
@@ -245,6 +422,68 @@ class DjangoBotRunner:
         self.bot_instance.refresh_from_db()
         return self.start()
 
+    def reload(self) -> bool:
+        """
+        Горячая перезагрузка сценария: перестраивает хэндлеры и заменяет их
+        в работающем приложении без остановки polling.
+        :return: True если хэндлеры заменены, иначе False
+        """
+        if not self.is_running or not self.application or not self.loop:
+            logger.warning(f"Bot {self.bot_instance.name} is not running, cannot reload")
+            return False
+        try:
+            self.bot_instance.refresh_from_db()
+            converter, handlers = self._build_handlers(
+                self.bot_instance.current_scenario
+            )
+            future = asyncio.run_coroutine_threadsafe(
+                self._swap_handlers(converter, handlers), self.loop
+            )
+            future.result(timeout=10.0)
+            logger.info(f"Bot {self.bot_instance.name} handlers reloaded")
+            return True
+        except Exception as e:
+            logger.error(f"Error reloading bot {self.bot_instance.name}: {e}")
+            return False
+
+    async def _swap_handlers(self, converter, handlers):
+        """
+        Заменяет хэндлеры приложения. Выполняется в event loop бота без
+        точек переключения, поэтому обновления видят либо старые, либо новые хэндлеры.
+        Текущие состояния разговоров переносятся, если состояние с тем же
+        именем есть в новой версии сценария.
+        """
+        old_handlers = self.scenario_handlers
+        old_states = self.converter.states if self.converter else {}
+        for new_handler in handlers:
+            if not isinstance(new_handler, ConversationHandler):
+                continue
+            for old_handler in old_handlers:
+                if isinstance(old_handler, ConversationHandler):
+                    self._migrate_conversations(
+                        old_handler, new_handler, old_states, converter.states
+                    )
+                    break
+        # Сначала добавляем новые хэндлеры, чтобы группа не оставалась пустой
+        for handler in handlers:
+            self.application.add_handler(handler)
+        for handler in old_handlers:
+            self.application.remove_handler(handler)
+        self.converter = converter
+        self.scenario_handlers = handlers
+
+    @staticmethod
+    def _migrate_conversations(old_handler, new_handler, old_states, new_states):
+        """
+        Переносит состояния разговоров из старого ConversationHandler в новый
+        по именам состояний сценария.
+        """
+        names = {index: name for name, index in old_states.items()}
+        for key, state in old_handler._conversations.items():
+            name = names.get(state)
+            if name in new_states:
+                new_handler._conversations[key] = new_states[name]
+
     async def _stop_async(self):
         """Асинхронная процедура остановки."""
         # Эта корутина будет запущена в целевом event loop
@@ -262,10 +501,29 @@ class DjangoBotRunner:
 running_bots = {}
 
 
-def start_bot_task(bot_id):
+def get_running_bot_ids() -> list:
+    """Возвращает id ботов, запущенных в этом процессе."""
+    return [bot_id for bot_id, runner in list(running_bots.items()) if runner.is_running]
+
+
+def release_lost_bot(bot_id):
+    """
+    Останавливает бота, аренду которого взял другой воркер,
+    не изменяя его статус в БД.
+    :param bot_id: int
+    """
+    runner = running_bots.pop(bot_id, None)
+    if runner:
+        runner.owns_status = False
+        runner.stop()
+
+
+def start_bot_task(bot_id, bot: Bot = None):
     """
     Запуск Telegram-бота по id.
     :param bot_id: int, id бота
+    :param bot: уже загруженный объект бота; в этом случае проверку, что бот
+        закреплен за текущим воркером, выполняет вызывающий код
     :return: True если успешно, иначе False
     """
     existing_runner = running_bots.get(bot_id)
@@ -273,14 +531,24 @@ def start_bot_task(bot_id):
         logger.warning(f"Start requested for bot {bot_id}, but it's already running.")
         return False
     try:
-        bot = Bot.objects.get_by_id(bot_id)
+        if bot is None:
+            if not worker_registry.is_owned_here(bot_id):
+                logger.warning(
+                    f"Bot {bot_id} is placed on another worker, skipping start"
+                )
+                return False
+            bot = Bot.objects.get_by_id(bot_id)
         if not bot or not bot.is_active:
             raise BotStartingError("Bot is not active or not found")
-        runner = DjangoBotRunner(bot)
+        runner = DjangoBotRunner(bot, host=get_bot_host())
         running_bots[bot_id] = runner
-        return runner.start()
+        result = runner.start()
+        if result:
+            worker_registry.set_placement(bot_id)
+        return result
     except Exception as e:
         logger.error(f"Error in start_bot_task for bot {bot_id}: {e}")
+        events.publish_event(bot_id, events.FAILED, error=str(e))
         existing_runner = running_bots.get(bot_id)
         if existing_runner:
             running_bots.pop(existing_runner)
@@ -299,18 +567,42 @@ def stop_bot_task(bot_id):
             logger.info("Runner found")
             result = runner.stop()
             running_bots.pop(bot_id, None)
+            worker_registry.clear_placement(bot_id)
             return result
         logger.warning("Runner not found")
+        if not worker_registry.is_owned_here(bot_id):
+            # Бот работает на другом воркере, его статус не трогаем
+            return False
         bot = Bot.objects.get_by_id(bot_id)
         if bot:
             bot.is_running = False
             bot.save(update_fields=['is_running'])
+            events.publish_event(bot_id, events.STOPPED)
         return False
     except Exception as e:
         logger.error(f"Error in stop_bot_task for bot {bot_id}: {e}")
         return False
 
 
+def reload_bot_task(bot_id):
+    """
+    Задача горячей перезагрузки сценария Telegram-бота по id.
+    Если бот не запущен в этом процессе, выполняется полный перезапуск.
+    :param bot_id: int
+    :return: True если успешно, иначе False
+    """
+    try:
+        runner = running_bots.get(bot_id)
+        if runner and runner.is_running:
+            if runner.reload():
+                return True
+            logger.warning(f"Hot reload failed for bot {bot_id}, restarting")
+        return restart_bot_task(bot_id)
+    except Exception as e:
+        logger.error(f"Error in reload_bot_task for bot {bot_id}: {e}")
+        return False
+
+
 def restart_bot_task(bot_id):
     """
     Задача перезагрузки Telegram-бота по id.
@@ -328,7 +620,7 @@ def restart_bot_task(bot_id):
         
         # Создаем нового runner с обновленными данными
         bot = Bot.objects.get_by_id(bot_id)
-        new_runner = DjangoBotRunner(bot)
+        new_runner = DjangoBotRunner(bot, host=get_bot_host())
         running_bots[bot_id] = new_runner
         
         # Останавливаем старого runner
@@ -345,6 +637,7 @@ def restart_bot_task(bot_id):
         start_result = new_runner.start()
         
         if start_result:
+            worker_registry.set_placement(bot_id)
             logger.info(f"Bot {bot_id} restarted successfully")
             return True
         else:
@@ -0,0 +1,353 @@
+from bisect import bisect
+import hashlib
+import json
+import logging
+import threading
+import time
+from django.conf import settings
+import redis
+from .redis_client import get_pool_stats, get_redis
+
+
+logger = logging.getLogger(__name__)
+
+# Общая очередь, используется, пока ни один воркер не зарегистрирован
+DEFAULT_QUEUE = "bot_operations"
+
+
+def get_worker_queue(worker_id: str) -> str:
+    """Собственная очередь воркера для задач управления его ботами."""
+    return f"{DEFAULT_QUEUE}.{worker_id}"
+
+
+def _hash(value: str) -> int:
+    return int(hashlib.md5(value.encode()).hexdigest(), 16)
+
+
+class HashRing:
+    """
+    Консистентное хэширование ботов по воркерам.
+    Количество виртуальных узлов воркера пропорционально его емкости.
+    """
+
+    def __init__(self, nodes: dict, replicas: int = 64):
+        """
+        :param nodes: словарь worker_id -> емкость (количество ботов)
+        :param replicas: количество виртуальных узлов на воркер средней емкости
+        """
+        self._ring = []
+        if not nodes:
+            return
+        average = sum(nodes.values()) / len(nodes) or 1
+        for node, capacity in nodes.items():
+            count = max(int(replicas * capacity / average), 1)
+            for i in range(count):
+                self._ring.append((_hash(f"{node}#{i}"), node))
+        self._ring.sort()
+        self._keys = [key for key, _ in self._ring]
+
+    def get(self, key) -> str:
+        """Возвращает воркер для ключа или None, если воркеров нет."""
+        if not self._ring:
+            return None
+        index = bisect(self._keys, _hash(str(key))) % len(self._ring)
+        return self._ring[index][1]
+
+
+class WorkerRegistry:
+    """
+    Реестр воркеров, на которых запускаются боты.
+    Воркеры периодически сообщают о себе в Redis (heartbeat с емкостью
+    и количеством ботов), а размещение ботов хранится в хэше bot_id -> worker_id.
+    """
+
+    WORKERS_KEY = "bots:workers"
+    PLACEMENT_KEY = "bots:placement"
+
+    # Продлевает аренду, только если она принадлежит воркеру или уже истекла
+    RENEW_LEASE_SCRIPT = """
+    local owner = redis.call('GET', KEYS[1])
+    if owner == false or owner == ARGV[1] then
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+        return 1
+    end
+    return 0
+    """
+    # Удаляет аренду, только если она принадлежит воркеру
+    RELEASE_LEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self):
+        self.redis = get_redis()
+        self.worker_id = None
+        self._ring = (None, None)
+        self._renew_lease = self.redis.register_script(self.RENEW_LEASE_SCRIPT)
+        self._release_lease = self.redis.register_script(self.RELEASE_LEASE_SCRIPT)
+
+    @staticmethod
+    def get_lease_key(bot_id) -> str:
+        return f"bots:lease:{bot_id}"
+
+    def heartbeat(self, bots_count: int):
+        """Обновляет информацию о текущем воркере."""
+        self.redis.hset(
+            self.WORKERS_KEY,
+            self.worker_id,
+            json.dumps(
+                {
+                    "capacity": settings.BOT_CLUSTER_CAPACITY,
+                    "bots": bots_count,
+                    "heartbeat": time.time(),
+                    "redis_pools": get_pool_stats(),
+                }
+            ),
+        )
+
+    def unregister(self):
+        """Удаляет текущий воркер из реестра."""
+        if self.worker_id:
+            self.redis.hdel(self.WORKERS_KEY, self.worker_id)
+
+    def get_live_workers(self) -> dict:
+        """
+        Возвращает живые воркеры: worker_id -> информация из heartbeat.
+        Воркеры без heartbeat дольше BOT_CLUSTER_WORKER_TTL удаляются из реестра.
+        """
+        deadline = time.time() - settings.BOT_CLUSTER_WORKER_TTL
+        workers, dead = {}, []
+        for worker_id, raw in self.redis.hgetall(self.WORKERS_KEY).items():
+            info = json.loads(raw)
+            if info["heartbeat"] >= deadline:
+                workers[worker_id.decode()] = info
+            else:
+                dead.append(worker_id)
+        if dead:
+            self.redis.hdel(self.WORKERS_KEY, *dead)
+        return workers
+
+    def get_hashed_worker(self, bot_id, workers: dict = None) -> str:
+        """Воркер, за которым бот закреплен консистентным хэшированием."""
+        if workers is None:
+            workers = self.get_live_workers()
+        return self._get_ring(workers).get(bot_id)
+
+    def _get_ring(self, workers: dict) -> HashRing:
+        """Кольцо хэширования для набора воркеров; перестраивается при его изменении."""
+        nodes = {worker_id: info["capacity"] for worker_id, info in workers.items()}
+        key, ring = self._ring
+        if key != nodes:
+            ring = HashRing(nodes, replicas=settings.BOT_CLUSTER_VNODES)
+            self._ring = (nodes, ring)
+        return ring
+
+    def get_placement(self, bot_id) -> str:
+        """Воркер, на котором бот запущен сейчас, или None."""
+        worker_id = self.redis.hget(self.PLACEMENT_KEY, bot_id)
+        return worker_id.decode() if worker_id else None
+
+    def set_placement(self, bot_id):
+        """Отмечает бота запущенным на текущем воркере и берет аренду бота."""
+        if self.worker_id:
+            with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(self.PLACEMENT_KEY, bot_id, self.worker_id)
+                pipe.set(
+                    self.get_lease_key(bot_id),
+                    self.worker_id,
+                    ex=settings.BOT_LEASE_TTL,
+                )
+                pipe.execute()
+
+    def acquire_lease(self, bot_id) -> bool:
+        """
+        Атомарно берет аренду бота для текущего воркера перед его запуском:
+        аренда свободна или уже принадлежит воркеру. Аренда выдается с запасом
+        на время запуска бота.
+        :return: False, если аренду держит другой воркер
+        """
+        if not self.worker_id:
+            return True
+        return bool(
+            self._renew_lease(
+                keys=[self.get_lease_key(bot_id)],
+                args=[self.worker_id, settings.BOT_LEASE_TTL * 3],
+            )
+        )
+
+    def clear_placement(self, bot_id):
+        """Снимает отметку о запуске бота на текущем воркере и освобождает аренду."""
+        if self.worker_id and self.get_placement(bot_id) == self.worker_id:
+            self.redis.hdel(self.PLACEMENT_KEY, bot_id)
+            self._release_lease(
+                keys=[self.get_lease_key(bot_id)], args=[self.worker_id]
+            )
+
+    def renew_leases(self, bot_ids) -> list:
+        """
+        Продлевает аренду ботов, запущенных на текущем воркере.
+        :return: список id ботов, аренду которых уже взял другой воркер
+        """
+        bot_ids = list(bot_ids)
+        if not bot_ids:
+            return []
+        with self.redis.pipeline(transaction=False) as pipe:
+            for bot_id in bot_ids:
+                self._renew_lease(
+                    keys=[self.get_lease_key(bot_id)],
+                    args=[self.worker_id, settings.BOT_LEASE_TTL],
+                    client=pipe,
+                )
+            results = pipe.execute()
+        return [bot_id for bot_id, renewed in zip(bot_ids, results) if not renewed]
+
+    def get_expired_leases(self, bot_ids) -> list:
+        """Возвращает id ботов, аренда которых истекла."""
+        bot_ids = list(bot_ids)
+        with self.redis.pipeline(transaction=False) as pipe:
+            for bot_id in bot_ids:
+                pipe.exists(self.get_lease_key(bot_id))
+            results = pipe.execute()
+        return [bot_id for bot_id, exists in zip(bot_ids, results) if not exists]
+
+    def get_placements(self) -> dict:
+        """Размещение всех ботов: bot_id -> worker_id."""
+        return {
+            int(bot_id): worker_id.decode()
+            for bot_id, worker_id in self.redis.hgetall(self.PLACEMENT_KEY).items()
+        }
+
+    def assign(self, bot_id, worker_id):
+        """
+        Переносит бота на другой воркер. Аренда выдается новому воркеру
+        с запасом на время запуска бота.
+        """
+        with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.PLACEMENT_KEY, bot_id, worker_id)
+            pipe.set(
+                self.get_lease_key(bot_id),
+                worker_id,
+                ex=settings.BOT_LEASE_TTL * 3,
+            )
+            pipe.execute()
+
+    def unassign(self, bot_id):
+        """Удаляет размещение бота, который не должен работать."""
+        with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hdel(self.PLACEMENT_KEY, bot_id)
+            pipe.delete(self.get_lease_key(bot_id))
+            pipe.execute()
+
+    def get_owner(self, bot_id) -> str:
+        """
+        Воркер, который должен управлять ботом: тот, где бот запущен,
+        если он жив, иначе воркер по консистентному хэшированию.
+        """
+        workers = self.get_live_workers()
+        worker_id = self.get_placement(bot_id)
+        if worker_id in workers:
+            return worker_id
+        return self.get_hashed_worker(bot_id, workers)
+
+    def get_queue_for_bot(self, bot_id) -> str:
+        """Очередь, в которую нужно отправлять задачи управления ботом."""
+        try:
+            worker_id = self.get_owner(bot_id)
+        except redis.RedisError as e:
+            logger.warning(f"Worker registry unavailable: {e}")
+            worker_id = None
+        return get_worker_queue(worker_id) if worker_id else DEFAULT_QUEUE
+
+    def get_queues_for_bots(self, bot_ids) -> dict:
+        """
+        Очереди задач управления для нескольких ботов.
+        :return: словарь bot_id -> очередь
+        """
+        try:
+            workers = self.get_live_workers()
+            placements = self.get_placements()
+        except redis.RedisError as e:
+            logger.warning(f"Worker registry unavailable: {e}")
+            return {bot_id: DEFAULT_QUEUE for bot_id in bot_ids}
+        queues = {}
+        for bot_id in bot_ids:
+            worker_id = placements.get(bot_id)
+            if worker_id not in workers:
+                worker_id = self.get_hashed_worker(bot_id, workers)
+            queues[bot_id] = get_worker_queue(worker_id) if worker_id else DEFAULT_QUEUE
+        return queues
+
+    @staticmethod
+    def get_least_loaded(workers: dict) -> str:
+        """Живой воркер с наименьшей загрузкой относительно емкости."""
+        if not workers:
+            return None
+        return min(
+            workers,
+            key=lambda worker_id: workers[worker_id]["bots"]
+            / (workers[worker_id]["capacity"] or 1),
+        )
+
+    def is_owned_here(
+        self, bot_id, workers: dict = None, placements: dict = None
+    ) -> bool:
+        """
+        Должен ли текущий воркер запускать бота: бот не запущен на другом
+        живом воркере и закреплен за текущим хэшированием.
+        :param workers: живые воркеры, если уже получены
+        :param placements: размещение всех ботов, если уже получено
+        """
+        if not self.worker_id:
+            return True
+        if workers is None:
+            workers = self.get_live_workers()
+        if placements is not None:
+            worker_id = placements.get(bot_id)
+        else:
+            worker_id = self.get_placement(bot_id)
+        if worker_id in workers:
+            return worker_id == self.worker_id
+        return self.get_hashed_worker(bot_id, workers) in (None, self.worker_id)
+
+
+worker_registry = WorkerRegistry()
+
+
+class WorkerHeartbeat(threading.Thread):
+    """
+    Поток, периодически отправляющий heartbeat текущего воркера
+    и продлевающий аренду запущенных на нем ботов.
+    """
+
+    def __init__(self, get_bot_ids, on_lease_lost=None):
+        """
+        :param get_bot_ids: функция, возвращающая id запущенных ботов
+        :param on_lease_lost: функция, вызываемая с id бота, аренду которого
+            взял другой воркер (бот нужно остановить, чтобы не было дублей)
+        """
+        super().__init__(name="BotWorkerHeartbeat", daemon=True)
+        self.get_bot_ids = get_bot_ids
+        self.on_lease_lost = on_lease_lost
+        self._stopped = threading.Event()
+
+    def beat(self):
+        """Один цикл heartbeat."""
+        bot_ids = self.get_bot_ids()
+        worker_registry.heartbeat(len(bot_ids))
+        for bot_id in worker_registry.renew_leases(bot_ids):
+            logger.warning(f"Lease of bot {bot_id} was taken by another worker")
+            if self.on_lease_lost:
+                self.on_lease_lost(bot_id)
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self.beat()
+            except Exception as e:
+                logger.error(f"Worker heartbeat failed: {e}")
+            self._stopped.wait(settings.BOT_CLUSTER_HEARTBEAT_INTERVAL)
+
+    def stop(self):
+        self._stopped.set()
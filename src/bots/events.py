@@ -0,0 +1,119 @@
+import json
+import logging
+import time
+from django.conf import settings
+from .cluster import worker_registry
+from .redis_client import get_async_redis, get_redis
+
+
+logger = logging.getLogger(__name__)
+
+# Состояния жизненного цикла бота, публикуемые в канал событий
+QUEUED = "queued"
+INITIALIZING = "initializing"
+POLLING = "polling"
+STOPPED = "stopped"
+FAILED = "failed"
+
+# Время хранения последнего события бота, сек.
+LAST_EVENT_TTL = 24 * 3600
+
+
+def get_events_channel(bot_id) -> str:
+    """Канал Redis pub/sub с событиями жизненного цикла бота."""
+    return f"bots:events:{bot_id}"
+
+
+def get_last_event_key(bot_id) -> str:
+    """Ключ Redis с последним событием бота для новых подписчиков."""
+    return f"bots:events:last:{bot_id}"
+
+
+def publish_event(bot_id, state, **data):
+    """
+    Публикует событие жизненного цикла бота.
+    :param bot_id: id бота
+    :param state: queued, initializing, polling, stopped или failed
+    :param data: дополнительные поля события (task_id, operation, error, ...)
+    """
+    publish_events([{"bot_id": bot_id, "state": state, **data}])
+
+
+def publish_events(events):
+    """
+    Публикует события нескольких ботов одним запросом к Redis. Ошибки Redis
+    только логируются, чтобы не мешать управлению ботами.
+    :param events: список словарей с ключами bot_id, state и дополнительными полями
+    """
+    if not events:
+        return
+    now = time.time()
+    try:
+        redis_client = get_redis()
+        with redis_client.pipeline(transaction=False) as pipe:
+            for event in events:
+                bot_id = event["bot_id"]
+                payload = json.dumps(
+                    {"ts": now, "worker": worker_registry.worker_id, **event}
+                )
+                pipe.set(get_last_event_key(bot_id), payload, ex=LAST_EVENT_TTL)
+                pipe.publish(get_events_channel(bot_id), payload)
+            pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to publish bot events: {e}")
+
+
+def get_last_event(bot_id, since=None):
+    """
+    Последнее событие бота, если оно новее since (короткий опрос для запуска
+    через WSGI, где поток server-sent events недоступен). Не ждет новых событий,
+    чтобы не занимать воркер.
+    :param since: время (ts) последнего полученного клиентом события
+    :return: событие или None, если новых событий нет
+    """
+    last = get_redis().get(get_last_event_key(bot_id))
+    if not last:
+        return None
+    event = json.loads(last)
+    if since is not None and event["ts"] <= since:
+        return None
+    return event
+
+
+def format_event(data) -> str:
+    """Событие в формате server-sent events."""
+    if isinstance(data, bytes):
+        data = data.decode()
+    return f"data: {data}\n\n"
+
+
+async def stream_events(bot_id, keepalive=None):
+    """
+    Асинхронный поток событий бота в формате server-sent events.
+    Сначала отдает последнее известное событие, затем новые события по мере
+    публикации. Если событий нет, раз в keepalive секунд отправляет комментарий,
+    чтобы прокси не закрывали соединение.
+    """
+    keepalive = keepalive or settings.BOT_EVENTS_KEEPALIVE
+    redis_client = get_async_redis()
+    pubsub = redis_client.pubsub()
+    try:
+        # Подписка до чтения последнего события, чтобы не пропустить новое
+        await pubsub.subscribe(get_events_channel(bot_id))
+        last = await redis_client.get(get_last_event_key(bot_id))
+        if last:
+            yield format_event(last)
+        sent_at = time.monotonic()
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=keepalive
+            )
+            if message is not None:
+                yield format_event(message["data"])
+            elif time.monotonic() - sent_at >= keepalive:
+                yield ": keepalive\n\n"
+            else:
+                continue
+            sent_at = time.monotonic()
+    finally:
+        await pubsub.aclose()
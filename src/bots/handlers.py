@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
+import asyncio
 import logging
 from telegram import ReplyKeyboardMarkup, Update
+from telegram.error import BadRequest
 from telegram.ext import (
     ContextTypes,
     ConversationHandler,
@@ -8,7 +10,10 @@ from telegram.ext import (
     MessageHandler,
     filters,
 )
+from django.conf import settings
 from .models import Scenario, Step
+from .history import SUMMARY_PREFIX, trim_history
+from .scenario_cache import scenario_cache
 
 
 logger = logging.getLogger(__name__)
@@ -59,17 +64,14 @@ class AbstractConverter(ABC):
         self.scenario = scenario
 
     @staticmethod
-    async def send_split_message(update: Update, text: str, max_length: int = 4096, reply_markup=None):
+    def split_text(text: str, max_length: int = 4096) -> list[str]:
         """
-        Отправляет сообщение по частям, если оно превышает лимит Telegram.
+        Разбивает текст на части не длиннее лимита Telegram.
 
-        :param update: Объект Update телеграма
-        :param text: Сообщение для отправки
-        :param max_length: Максимально допустимая длина текста
+        :param text: Исходный текст
+        :param max_length: Максимально допустимая длина части
+        :return: Список частей текста
         """
-        if len(text) <= max_length:
-            await update.message.reply_text(text=text, reply_markup=reply_markup)
-            return
         parts = []
         while text:
             if len(text) > max_length:
@@ -84,12 +86,104 @@ class AbstractConverter(ABC):
             else:
                 parts.append(text)
                 break
+        return parts
+
+    @staticmethod
+    async def send_split_message(update: Update, text: str, max_length: int = 4096, reply_markup=None):
+        """
+        Отправляет сообщение по частям, если оно превышает лимит Telegram.
+
+        :param update: Объект Update телеграма
+        :param text: Сообщение для отправки
+        :param max_length: Максимально допустимая длина текста
+        """
+        if len(text) <= max_length:
+            await update.message.reply_text(text=text, reply_markup=reply_markup)
+            return
+        parts = AbstractConverter.split_text(text, max_length)
         for i, part in enumerate(parts):
             if i == len(parts) - 1:
                 await update.message.reply_text(text=part, reply_markup=reply_markup)
             else:
                 await update.message.reply_text(text=part)
 
+    @staticmethod
+    async def send_streamed_message(
+        update: Update, chunks, max_length: int = 4096, reply_markup=None
+    ) -> str:
+        """
+        Отправляет ответ по мере поступления фрагментов: первое сообщение
+        отправляется с первым фрагментом, затем редактируется не чаще
+        BOT_STREAM_EDIT_INTERVAL секунд. При превышении лимита Telegram
+        текст переносится в новое сообщение.
+
+        :param update: Объект Update телеграма
+        :param chunks: Асинхронный итератор фрагментов текста
+        :param max_length: Максимально допустимая длина текста сообщения
+        :param reply_markup: Клавиатура, отправляется с первым сообщением
+        :return: Полный текст ответа
+        """
+        loop = asyncio.get_running_loop()
+        full_text = ""
+        pending = ""  # текст текущего (последнего) сообщения
+        sent_text = ""  # текст, который уже отображается в текущем сообщении
+        message = None
+        last_edit = 0.0
+
+        async def flush():
+            nonlocal sent_text, last_edit
+            if message is not None and pending != sent_text:
+                try:
+                    await message.edit_text(text=pending)
+                except BadRequest as e:
+                    # Telegram отклоняет правки, не меняющие видимый текст
+                    if "not modified" not in str(e):
+                        raise
+                sent_text = pending
+                last_edit = loop.time()
+
+        async for chunk in chunks:
+            full_text += chunk
+            pending += chunk
+            if len(pending) > max_length:
+                parts = AbstractConverter.split_text(pending, max_length)
+                pending = parts[0]
+                if message is None:
+                    message = await update.message.reply_text(
+                        text=pending, reply_markup=reply_markup
+                    )
+                    sent_text = pending
+                else:
+                    await flush()
+                # Последняя часть становится новым текущим сообщением
+                for part in parts[1:]:
+                    pending = part
+                    message = await update.message.reply_text(text=pending)
+                    sent_text = pending
+                last_edit = loop.time()
+            elif message is None:
+                if pending.strip():
+                    message = await update.message.reply_text(
+                        text=pending, reply_markup=reply_markup
+                    )
+                    sent_text = pending
+                    last_edit = loop.time()
+            elif loop.time() - last_edit >= settings.BOT_STREAM_EDIT_INTERVAL:
+                await flush()
+        await flush()
+        return full_text
+
+    @staticmethod
+    async def iter_completion_stream(stream):
+        """
+        Возвращает текстовые фрагменты из потокового ответа AI модели.
+
+        :param stream: Поток chunk-ов chat.completions
+        """
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
     @abstractmethod
     def create_handlers(self, bot_runner):
         """
@@ -110,6 +204,7 @@ class ConversationConverter(AbstractConverter):
         super().__init__(scenario)
         self.states = {}
         self._state_index = -1
+        self._summarizing = set()
 
     def add_state(self, state: str):
         """
@@ -129,9 +224,9 @@ class ConversationConverter(AbstractConverter):
         :param bot_runner: Экземпляр runner-а бота (context)
         :return: Список ConversationHandler
         """
-        steps = Step.objects.for_scenario(scenario_id=self.scenario.id)
+        compiled = scenario_cache.get(self.scenario.id)
         handler_args = {"entry_points": [], "states": {}, "fallbacks": []}
-        for step in steps:
+        for step in compiled.steps:
             if Step.Template(step.template).is_command:
                 command = step.handler_data.get(
                     "command", Step.Template(step.template).label
@@ -142,7 +237,7 @@ class ConversationConverter(AbstractConverter):
             else:
                 regex = step.handler_data.get("filter_regex")
                 if regex:
-                    step_filter = filters.Regex(regex)
+                    step_filter = filters.Regex(compiled.patterns[regex])
                 else:
                     step_filter = filters.TEXT & ~filters.COMMAND
                 handler = MessageHandler(
@@ -167,6 +262,50 @@ class ConversationConverter(AbstractConverter):
         conv_handler = ConversationHandler(**handler_args)
         return [conv_handler]
 
+    async def summarize_history(self, bot_runner, chat_id, messages: list):
+        """
+        Сжимает старую часть истории чата в одно системное сообщение
+        с кратким содержанием. Выполняется в фоне после ответа пользователю.
+
+        :param bot_runner: runner бота
+        :param chat_id: id чата
+        :param messages: сообщения из начала истории, которые нужно сжать
+        """
+        if chat_id in self._summarizing:
+            return
+        self._summarizing.add(chat_id)
+        try:
+            dialog = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+            async with bot_runner.ai_semaphore:
+                response = await bot_runner.ai_client.chat.completions.create(
+                    model=bot_runner.ai_model,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "Кратко перескажи переписку, сохранив факты, "
+                            "договоренности и данные пользователя.",
+                        },
+                        {"role": "user", "content": dialog},
+                    ],
+                )
+            summary = response.choices[0].message.content
+            compacted = await bot_runner.history.compact(
+                chat_id,
+                messages,
+                {"role": "system", "content": f"{SUMMARY_PREFIX} {summary}"},
+            )
+            if not compacted:
+                logger.info(
+                    f"History of chat {chat_id} changed during summarizing, "
+                    f"bot {bot_runner.bot_instance.name}: summary skipped"
+                )
+        except Exception as e:
+            logger.error(
+                f"Error summarizing history, bot {bot_runner.bot_instance.name}: {e}"
+            )
+        finally:
+            self._summarizing.discard(chat_id)
+
     def handle_step(self, step: Step, bot_runner):
         """
         Возвращает асинхронную функцию-обработчик для конкретного шага сценария.
@@ -181,7 +320,7 @@ class ConversationConverter(AbstractConverter):
         ):
             """Очищает историю общения с ботом (если шаг - очистка истории)"""
             chat_id = update.effective_chat.id
-            bot_runner.history[chat_id] = []
+            await bot_runner.history.clear(chat_id)
 
         async def step_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             """Отправляет текст сообщения по сценарию и клавиатуру, если она задана."""
@@ -203,7 +342,13 @@ class ConversationConverter(AbstractConverter):
             chat_id = update.effective_chat.id
             if system:
                 messages.append({"role": "system", "content": system})
-            history = bot_runner.history.get(chat_id, list())
+            history = await bot_runner.history.get(chat_id)
+            history, dropped = trim_history(
+                history,
+                step.handler_data.get(
+                    "history_tokens", settings.BOT_HISTORY_TOKEN_BUDGET
+                ),
+            )
             if history:
                 messages.extend(history)
             text = update.message.text
@@ -219,19 +364,38 @@ class ConversationConverter(AbstractConverter):
                 text = f"{text}\nДополнительный контекст: {ai_context}"
             question = {"role": "user", "content": text}
             messages.append(question)
-            response = bot_runner.ai_client.chat.completions.create(
-                model=bot_runner.ai_model, messages=messages
-            )
+            is_streaming = step.handler_data.get("stream", False)
+            async with bot_runner.ai_semaphore:
+                if is_streaming:
+                    stream = await bot_runner.ai_client.chat.completions.create(
+                        model=bot_runner.ai_model, messages=messages, stream=True
+                    )
+                    answer = await self.send_streamed_message(
+                        update,
+                        self.iter_completion_stream(stream),
+                        reply_markup=reply_markup,
+                    )
+                else:
+                    response = await bot_runner.ai_client.chat.completions.create(
+                        model=bot_runner.ai_model, messages=messages
+                    )
+                    answer = response.choices[0].message.content
 
-            history.append(question)
-            history.append(
+            await bot_runner.history.append(
+                chat_id,
+                question,
                 {
                     "role": "assistant",
-                    "content": response.choices[0].message.content,
-                }
+                    "content": answer,
+                },
             )
-            bot_runner.history[chat_id] = history
-            await self.send_split_message(update, response.choices[0].message.content, reply_markup=reply_markup)
+            if not is_streaming:
+                await self.send_split_message(update, answer, reply_markup=reply_markup)
+            if dropped and step.handler_data.get("summarize", False):
+                context.application.create_task(
+                    self.summarize_history(bot_runner, chat_id, dropped),
+                    update=update,
+                )
 
         actions = []
         if step.template == step.Template.CLEAR:
@@ -0,0 +1,275 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+import json
+import logging
+import time
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .redis_client import get_async_redis
+
+
+logger = logging.getLogger(__name__)
+
+# Служебные токены, которые модель добавляет к каждому сообщению
+MESSAGE_TOKENS_OVERHEAD = 4
+# Префикс системного сообщения с кратким содержанием старой части переписки
+SUMMARY_PREFIX = "Краткое содержание предыдущей переписки:"
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """Возвращает токенизатор tiktoken, если пакет установлен, иначе None."""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Оценка количества токенов в тексте.
+    Использует tiktoken при наличии, иначе грубую оценку по длине текста.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # Для кириллицы в среднем выходит около 3 символов на токен
+    return len(text) // 3 + 1
+
+
+def estimate_message_tokens(message: dict) -> int:
+    """Оценка количества токенов в сообщении чата."""
+    return estimate_tokens(message.get("content") or "") + MESSAGE_TOKENS_OVERHEAD
+
+
+def is_summary(message: dict) -> bool:
+    """Проверяет, является ли сообщение кратким содержанием переписки."""
+    return message.get("role") == "system" and (
+        message.get("content") or ""
+    ).startswith(SUMMARY_PREFIX)
+
+
+def trim_history(messages: list, max_tokens: int) -> tuple[list, list]:
+    """
+    Оставляет последние сообщения истории, укладывающиеся в бюджет токенов.
+    Краткое содержание в начале истории всегда сохраняется в окне.
+
+    :param messages: История чата
+    :param max_tokens: Бюджет токенов на историю
+    :return: (окно истории для запроса, отброшенные сообщения вместе с кратким
+        содержанием - их можно заменить новым кратким содержанием)
+    """
+    summary = messages[0] if messages and is_summary(messages[0]) else None
+    turns = messages[1:] if summary else messages
+    budget = max_tokens - (estimate_message_tokens(summary) if summary else 0)
+    start = len(turns)
+    total = 0
+    while start > 0:
+        tokens = estimate_message_tokens(turns[start - 1])
+        if total + tokens > budget:
+            break
+        total += tokens
+        start -= 1
+    head = [summary] if summary else []
+    dropped = head + turns[:start] if start else []
+    return head + turns[start:], dropped
+
+
+class BaseHistoryStore(ABC):
+    """
+    Абстрактное хранилище истории переписки бота.
+    Ограничивает историю каждого чата по количеству сообщений и токенов,
+    неактивные чаты удаляются по истечении ttl.
+    """
+
+    def __init__(self, bot_id, max_messages=None, max_tokens=None, ttl=None):
+        """
+        :param bot_id: id бота, которому принадлежит история
+        :param max_messages: максимум сообщений в истории одного чата
+        :param max_tokens: максимум токенов в истории одного чата
+        :param ttl: время жизни истории неактивного чата, сек.
+        """
+        self.bot_id = bot_id
+        self.max_messages = max_messages or settings.BOT_HISTORY_MAX_MESSAGES
+        self.max_tokens = max_tokens or settings.BOT_HISTORY_MAX_TOKENS
+        self.ttl = ttl or settings.BOT_HISTORY_TTL
+
+    def _apply_limits(self, messages: list) -> list:
+        """Отбрасывает самые старые сообщения сверх лимитов."""
+        messages = messages[-self.max_messages:]
+        total = sum(estimate_message_tokens(m) for m in messages)
+        start = 0
+        while total > self.max_tokens and start < len(messages) - 1:
+            total -= estimate_message_tokens(messages[start])
+            start += 1
+        return messages[start:]
+
+    @abstractmethod
+    async def get(self, chat_id) -> list:
+        """Возвращает историю чата."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def append(self, chat_id, *messages):
+        """Добавляет сообщения в историю чата."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def clear(self, chat_id):
+        """Очищает историю чата."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def compact(self, chat_id, messages: list, message: dict) -> bool:
+        """
+        Заменяет сообщения messages в начале истории чата одним сообщением.
+        Если история с момента чтения изменилась и уже не начинается с messages
+        (например, начало обрезано по лимитам), ничего не делает.
+        :return: True если история сжата
+        """
+        raise NotImplementedError
+
+
+class InMemoryHistoryStore(BaseHistoryStore):
+    """
+    История в памяти процесса с вытеснением давно неиспользуемых чатов (LRU).
+    Теряется при перезапуске бота.
+    """
+
+    def __init__(self, bot_id, max_chats=None, **kwargs):
+        """
+        :param max_chats: максимум чатов, хранимых в памяти
+        """
+        super().__init__(bot_id, **kwargs)
+        self.max_chats = max_chats or settings.BOT_HISTORY_MAX_CHATS
+        self._chats = OrderedDict()
+
+    def _evict(self):
+        """Удаляет просроченные чаты и чаты сверх лимита."""
+        deadline = time.monotonic() - self.ttl
+        while self._chats:
+            chat_id, (touched, _) = next(iter(self._chats.items()))
+            if touched >= deadline and len(self._chats) <= self.max_chats:
+                break
+            self._chats.pop(chat_id)
+
+    async def get(self, chat_id) -> list:
+        self._evict()
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            return []
+        self._chats[chat_id] = (time.monotonic(), entry[1])
+        self._chats.move_to_end(chat_id)
+        return list(entry[1])
+
+    async def append(self, chat_id, *messages):
+        _, history = self._chats.pop(chat_id, (None, []))
+        self._chats[chat_id] = (
+            time.monotonic(),
+            self._apply_limits(history + list(messages)),
+        )
+        self._evict()
+
+    async def clear(self, chat_id):
+        self._chats.pop(chat_id, None)
+
+    async def compact(self, chat_id, messages: list, message: dict) -> bool:
+        entry = self._chats.get(chat_id)
+        if entry is None or entry[1][: len(messages)] != messages:
+            return False
+        self._chats[chat_id] = (entry[0], [message] + entry[1][len(messages):])
+        return True
+
+
+class RedisHistoryStore(BaseHistoryStore):
+    """
+    История в Redis (REDIS_URL): переживает перезапуск бота,
+    неактивные чаты удаляются Redis по истечении ttl.
+    """
+
+    # Удаляет начало истории (ARGV[3:]), только если история все еще с него
+    # начинается, и при необходимости ставит на его место сообщение ARGV[1]
+    TRIM_HEAD_SCRIPT = """
+    local count = #ARGV - 2
+    local head = redis.call('LRANGE', KEYS[1], 0, count - 1)
+    if #head ~= count then
+        return 0
+    end
+    for i = 1, count do
+        if head[i] ~= ARGV[i + 2] then
+            return 0
+        end
+    end
+    redis.call('LTRIM', KEYS[1], count, -1)
+    if ARGV[1] ~= '' then
+        redis.call('LPUSH', KEYS[1], ARGV[1])
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+    """
+
+    def __init__(self, bot_id, redis_url=None, **kwargs):
+        super().__init__(bot_id, **kwargs)
+        self.redis_url = redis_url
+
+    @property
+    def redis(self):
+        # Соединения привязаны к event loop, поэтому клиент берется из пула loop-а бота
+        return get_async_redis(self.redis_url)
+
+    def _key(self, chat_id) -> str:
+        return f"bots:history:{self.bot_id}:{chat_id}"
+
+    async def _trim_head(self, chat_id, head: list, replacement: str = "") -> bool:
+        """Атомарно удаляет начало истории head (см. TRIM_HEAD_SCRIPT)."""
+        script = self.redis.register_script(self.TRIM_HEAD_SCRIPT)
+        result = await script(
+            keys=[self._key(chat_id)], args=[replacement, self.ttl, *head]
+        )
+        return bool(result)
+
+    async def get(self, chat_id) -> list:
+        key = self._key(chat_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.lrange(key, 0, -1)
+            pipe.expire(key, self.ttl)
+            raw, _ = await pipe.execute()
+        return self._apply_limits([json.loads(item) for item in raw])
+
+    async def append(self, chat_id, *messages):
+        key = self._key(chat_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *[json.dumps(m, ensure_ascii=False) for m in messages])
+            pipe.ltrim(key, -self.max_messages, -1)
+            pipe.expire(key, self.ttl)
+            pipe.lrange(key, 0, -1)
+            *_, raw = await pipe.execute()
+        history = [json.loads(item) for item in raw]
+        dropped = len(history) - len(self._apply_limits(history))
+        if dropped:
+            # Если начало уже изменилось, лимиты применит следующее добавление
+            await self._trim_head(chat_id, raw[:dropped])
+
+    async def clear(self, chat_id):
+        await self.redis.delete(self._key(chat_id))
+
+    async def compact(self, chat_id, messages: list, message: dict) -> bool:
+        return await self._trim_head(
+            chat_id,
+            [json.dumps(m, ensure_ascii=False) for m in messages],
+            json.dumps(message, ensure_ascii=False),
+        )
+
+
+def get_history_store(bot_id) -> BaseHistoryStore:
+    """
+    Создает хранилище истории бота согласно настройке BOT_HISTORY_BACKEND.
+    :param bot_id: id бота
+    """
+    store_cls = import_string(settings.BOT_HISTORY_BACKEND)
+    return store_cls(bot_id)
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import time
+from django.conf import settings
+from telegram.request import HTTPXRequest
+from .redis_client import get_async_redis, get_redis
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_heartbeat_key(bot_id) -> str:
+    """Ключ Redis с heartbeat запущенного бота."""
+    return f"bots:heartbeat:{bot_id}"
+
+
+class BotLiveness:
+    """
+    Показатели живости запущенного бота: время последнего обработанного
+    обновления, последнего цикла получения обновлений и количество ошибок.
+    Обновляются в event loop бота и ничего не стоят для обработки обновлений.
+    """
+
+    def __init__(self, bot_id):
+        self.bot_id = bot_id
+        self.started_at = time.time()
+        self.last_update = None
+        self.last_poll = None
+        self.errors = 0
+
+    def mark_update(self):
+        self.last_update = time.time()
+
+    def mark_poll(self):
+        self.last_poll = time.time()
+
+    def mark_error(self):
+        self.errors += 1
+
+    def snapshot(self, application, worker_id=None) -> dict:
+        """Текущее состояние бота для публикации в Redis."""
+        return {
+            "bot_id": self.bot_id,
+            "worker": worker_id,
+            "ts": time.time(),
+            "started_at": self.started_at,
+            "last_update": self.last_update,
+            "last_poll": self.last_poll,
+            "queue_depth": application.update_queue.qsize(),
+            "errors": self.errors,
+        }
+
+
+class LivenessRequest(HTTPXRequest):
+    """Запрос getUpdates, отмечающий каждый завершенный цикл long polling."""
+
+    def __init__(self, liveness: BotLiveness, **kwargs):
+        super().__init__(**kwargs)
+        self.liveness = liveness
+
+    async def do_request(self, *args, **kwargs):
+        result = await super().do_request(*args, **kwargs)
+        self.liveness.mark_poll()
+        return result
+
+
+async def publish_heartbeats(liveness: BotLiveness, application, worker_id=None):
+    """
+    Периодически публикует heartbeat бота в Redis (BOT_HEARTBEAT_INTERVAL).
+    Работает в event loop бота, поэтому зависший loop перестает обновлять
+    heartbeat, и ключ истекает.
+    """
+    key = get_heartbeat_key(liveness.bot_id)
+    ttl = max(int(settings.BOT_HEARTBEAT_INTERVAL * 3), 1)
+    redis_client = get_async_redis()
+    try:
+        while True:
+            try:
+                await redis_client.set(
+                    key,
+                    json.dumps(liveness.snapshot(application, worker_id)),
+                    ex=ttl,
+                )
+            except Exception as e:
+                logger.warning(f"Heartbeat of bot {liveness.bot_id} failed: {e}")
+            await asyncio.sleep(settings.BOT_HEARTBEAT_INTERVAL)
+    finally:
+        await redis_client.delete(key)
+
+
+def read_heartbeats(bot_ids) -> dict:
+    """
+    Читает heartbeat нескольких ботов одним запросом.
+    :return: словарь bot_id -> heartbeat (None, если бот не публикует heartbeat)
+    """
+    bot_ids = list(bot_ids)
+    if not bot_ids:
+        return {}
+    redis_client = get_redis()
+    values = redis_client.mget([get_heartbeat_key(bot_id) for bot_id in bot_ids])
+    return {
+        bot_id: json.loads(value) if value else None
+        for bot_id, value in zip(bot_ids, values)
+    }
+
+
+def evaluate_heartbeat(bot_id, heartbeat, now=None) -> dict:
+    """
+    Оценивает живость бота по heartbeat.
+    - healthy: бот публикует heartbeat и получает обновления;
+    - hung: event loop бота работает, но цикл получения обновлений давно не завершался;
+    - down: heartbeat отсутствует или устарел (бот не запущен или loop завис).
+    """
+    now = now or time.time()
+    if not heartbeat or now - heartbeat["ts"] > settings.BOT_HEARTBEAT_INTERVAL * 3:
+        return {"status": "down", "bot_id": bot_id, "heartbeat": heartbeat}
+    last_poll = heartbeat["last_poll"] or heartbeat["started_at"]
+    if now - last_poll > settings.BOT_POLL_STALL_TIMEOUT:
+        return {
+            "status": "hung",
+            "bot_id": bot_id,
+            "heartbeat": heartbeat,
+            "error": f"No poll cycle for {int(now - last_poll)}s",
+        }
+    return {"status": "healthy", "bot_id": bot_id, "heartbeat": heartbeat}
@@ -1,8 +1,22 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from asgiref.sync import sync_to_async
 
 
 class BotManager(models.Manager):
+    def get_queryset(self):
+        """
+        Зашифрованные секреты бота (SECRET_FIELDS) по умолчанию не загружаются,
+        чтобы не расшифровывать их при каждом чтении. Для загрузки используйте
+        with_secrets() или bots.secrets.secret_cache.
+        """
+        return super().get_queryset().defer(*self.model.SECRET_FIELDS)
+
+    def with_secrets(self):
+        """Возвращает QuerySet ботов вместе с расшифрованными секретами."""
+        return super().get_queryset()
+
     def get_active_bots(self, user=None):
         """Возвращает все активные боты, опционально для конкретного пользователя."""
         qs = self.filter(is_active=True)
@@ -93,6 +107,14 @@ class BotManager(models.Manager):
             # Посчитаем все шаги этих сценариев
             return Step.objects.filter(scenario_id__in=scenario_ids).count()
 
+    def get_counts(self):
+        """Количество всех, активных и запущенных ботов одним запросом."""
+        return self.aggregate(
+            total=Count("id"),
+            active=Count("id", filter=Q(is_active=True)),
+            running=Count("id", filter=Q(is_running=True)),
+        )
+
     @sync_to_async
     def async_get_by_id(self, bot_id):
         return self.get_by_id(bot_id=bot_id)
@@ -106,6 +128,12 @@ class StepManager(models.Manager):
             .all()
         )
 
+    def get_counts(self):
+        """Количество всех и активных шагов одним запросом."""
+        return self.aggregate(
+            total=Count("id"), active=Count("id", filter=Q(is_active=True))
+        )
+
     def get_steps(self, bot_id: None):
         steps = self.select_related("scenario").prefetch_related("scenario__bots")
         if bot_id:
@@ -114,6 +142,21 @@ class StepManager(models.Manager):
 
 
 class ScenarioManager(models.Manager):
+    def refresh_active_steps_count(self, *scenario_ids):
+        """Пересчитывает количество активных шагов сценариев одним запросом."""
+        from .models import Step
+
+        active_steps = (
+            Step.objects.filter(scenario=OuterRef("pk"), is_active=True)
+            .order_by()
+            .values("scenario")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        return self.filter(pk__in=scenario_ids).update(
+            active_steps_count=Coalesce(Subquery(active_steps), 0)
+        )
+
     def get_scenarios_with_bots_and_steps(self):
         scenarios = self.prefetch_related("bots", "steps")
         return scenarios
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bots", "0004_alter_scenario_scenario_type_alter_step_handler_data_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bot",
+            name="ai_max_concurrency",
+            field=models.PositiveSmallIntegerField(
+                default=10,
+                help_text="Максимальное количество одновременных запросов бота к AI модели.",
+                verbose_name="лимит параллельных запросов к AI",
+            ),
+        ),
+    ]
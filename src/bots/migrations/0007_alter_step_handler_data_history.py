@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bots", "0006_alter_step_handler_data_stream"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="step",
+            name="handler_data",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text='Формат данных - словарь \n        {"keyboard": list[list[str]], "system": str, "context": str, "command": str, "filter_regex": str,\n        "stream": bool, "history_tokens": int, "summarize": bool}. \n        Все ключи необязательны, лишние ключи игнорируются. \n        - keyboard: список кнопок в клавиатуре,\n        - system: системный промпт для AI модели,\n        - context: дополнительные данные для анализа при обращении к AI,\n        - filter_regex: регулярное выражение для фильтрации хэндлера телеграм,\n        - command: команда, вызывающая соответствующий хэндлер,\n        - stream: потоковая отправка ответа AI с постепенным редактированием сообщения,\n        - history_tokens: бюджет токенов истории переписки в запросе к AI,\n        - summarize: сжимать не поместившуюся в бюджет историю в краткое содержание.',
+                verbose_name="Настройки для хендлеров",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bots", "0007_alter_step_handler_data_history"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="bot",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="bot_created_at_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:08
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_active_steps_count(apps, schema_editor):
+    Scenario = apps.get_model("bots", "Scenario")
+    Step = apps.get_model("bots", "Step")
+    active_steps = (
+        Step.objects.filter(scenario=OuterRef("pk"), is_active=True)
+        .order_by()
+        .values("scenario")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    Scenario.objects.update(active_steps_count=Coalesce(Subquery(active_steps), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bots", "0008_bot_created_at_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scenario",
+            name="active_steps_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Обновляется автоматически при изменении шагов.",
+                verbose_name="активных шагов",
+            ),
+        ),
+        migrations.RunPython(fill_active_steps_count, migrations.RunPython.noop),
+    ]
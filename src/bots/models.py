@@ -42,6 +42,12 @@ class Scenario(models.Model):
         help_text="Тип сценария определяет алгоритм конвертации шагов в код."
         "'CS' (CONVERSATION) это алгоритм на основе telegram.ext.ConversationHandler."
     )
+    active_steps_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="активных шагов",
+        help_text="Обновляется автоматически при изменении шагов.",
+    )
 
     objects = ScenarioManager()
 
@@ -120,13 +126,17 @@ class Step(models.Model):
         default=dict,
         blank=True,
         help_text='''Формат данных - словарь 
-        {"keyboard": list[list[str]], "system": str, "context": str, "command": str, "filter_regex": str}. 
+        {"keyboard": list[list[str]], "system": str, "context": str, "command": str, "filter_regex": str,
+        "stream": bool, "history_tokens": int, "summarize": bool}. 
         Все ключи необязательны, лишние ключи игнорируются. 
         - keyboard: список кнопок в клавиатуре,
         - system: системный промпт для AI модели,
         - context: дополнительные данные для анализа при обращении к AI,
         - filter_regex: регулярное выражение для фильтрации хэндлера телеграм,
-        - command: команда, вызывающая соответствующий хэндлер.'''
+        - command: команда, вызывающая соответствующий хэндлер,
+        - stream: потоковая отправка ответа AI с постепенным редактированием сообщения,
+        - history_tokens: бюджет токенов истории переписки в запросе к AI,
+        - summarize: сжимать не поместившуюся в бюджет историю в краткое содержание.'''
     )
     # тип - словарь с полями:
     # keyboard: list[list[str]] - список кнопок в клавиатуре
@@ -134,6 +144,9 @@ class Step(models.Model):
     # context: str - дополнительные данные для анализа
     # filter_regex: str - фильтр
     # command: str
+    # stream: bool - потоковая отправка ответа AI
+    # history_tokens: int - бюджет токенов истории
+    # summarize: bool - краткое содержание старой истории
 
     objects = StepManager()
 
@@ -177,6 +190,11 @@ class Bot(models.Model):
         null=True,
         default="",
     )
+    ai_max_concurrency = models.PositiveSmallIntegerField(
+        default=10,
+        verbose_name="лимит параллельных запросов к AI",
+        help_text="Максимальное количество одновременных запросов бота к AI модели.",
+    )
     telegram_token = EncryptedCharField(
         max_length=200, blank=True, null=True, verbose_name="телеграм токен"
     )
@@ -210,6 +228,9 @@ class Bot(models.Model):
 
     objects = BotManager()
 
+    # Зашифрованные поля, которые не загружаются по умолчанию
+    SECRET_FIELDS = ("telegram_token", "gpt_api_key")
+
     class Meta:
         verbose_name = "бот"
         verbose_name_plural = "боты"
@@ -218,6 +239,10 @@ class Bot(models.Model):
                 fields=["owner", "name"], name="unique_name_per_owner"
             )
         ]
+        indexes = [
+            # Курсорная пагинация списка ботов
+            models.Index(fields=["-created_at", "-id"], name="bot_created_at_id_idx"),
+        ]
 
     def clean(self):
         if self.is_active and (
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import weakref
+from django.conf import settings
+import redis
+import redis.asyncio as aioredis
+
+
+# Синхронные пулы: адрес Redis -> пул
+_pools = {}
+# Соединения redis.asyncio привязаны к event loop, поэтому асинхронные пулы
+# создаются для каждого loop (ботов, хостов ботов, ASGI-сервера): loop -> адрес -> пул
+_async_pools = weakref.WeakKeyDictionary()
+_pools_lock = threading.Lock()
+
+
+def _pool_options() -> dict:
+    return {
+        "timeout": settings.REDIS_POOL_TIMEOUT,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": settings.REDIS_CONNECT_TIMEOUT,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+
+
+def get_redis_pool(url=None) -> redis.ConnectionPool:
+    """
+    Общий для процесса пул соединений с Redis по адресу url (по умолчанию REDIS_URL).
+    Если все REDIS_MAX_CONNECTIONS соединений заняты, запрос ждет освобождения
+    соединения до REDIS_POOL_TIMEOUT секунд. После fork пул пересоздается redis-py.
+    """
+    url = url or settings.REDIS_URL
+    pool = _pools.get(url)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(url)
+            if pool is None:
+                pool = redis.BlockingConnectionPool.from_url(
+                    url, max_connections=settings.REDIS_MAX_CONNECTIONS, **_pool_options()
+                )
+                _pools[url] = pool
+    return pool
+
+
+def get_redis(url=None) -> redis.Redis:
+    """Клиент Redis на общем пуле соединений процесса."""
+    return redis.Redis(connection_pool=get_redis_pool(url))
+
+
+def get_async_redis_pool(url=None) -> aioredis.ConnectionPool:
+    """
+    Пул асинхронных соединений с Redis для текущего event loop.
+    Вызывается только из корутин.
+    """
+    url = url or settings.REDIS_URL
+    loop = asyncio.get_running_loop()
+    pools = _async_pools.get(loop)
+    pool = pools.get(url) if pools else None
+    if pool is None:
+        with _pools_lock:
+            pools = _async_pools.setdefault(loop, {})
+            pool = pools.get(url)
+            if pool is None:
+                pool = aioredis.BlockingConnectionPool.from_url(
+                    url,
+                    max_connections=settings.REDIS_ASYNC_MAX_CONNECTIONS,
+                    **_pool_options(),
+                )
+                pools[url] = pool
+    return pool
+
+
+def get_async_redis(url=None) -> aioredis.Redis:
+    """Асинхронный клиент Redis на пуле текущего event loop."""
+    return aioredis.Redis(connection_pool=get_async_redis_pool(url))
+
+
+async def close_async_redis():
+    """Закрывает соединения пулов текущего event loop перед его остановкой."""
+    with _pools_lock:
+        pools = _async_pools.pop(asyncio.get_running_loop(), {})
+    for pool in pools.values():
+        await pool.disconnect()
+
+
+def _get_usage(pool) -> dict:
+    if isinstance(pool, redis.BlockingConnectionPool):
+        idle = sum(1 for connection in list(pool.pool.queue) if connection)
+        created = len(pool._connections)
+    else:
+        idle = len(pool._available_connections)
+        created = idle + len(pool._in_use_connections)
+    in_use = created - idle
+    kwargs = pool.connection_kwargs
+    address = kwargs.get("path") or f"{kwargs.get('host')}:{kwargs.get('port')}"
+    return {
+        "redis": f"{address}/{kwargs.get('db', 0)}",
+        "max_connections": pool.max_connections,
+        "created": created,
+        "in_use": in_use,
+        "idle": idle,
+        "usage": round(in_use / pool.max_connections, 3),
+    }
+
+
+def get_pool_stats() -> dict:
+    """
+    Использование пулов соединений процесса: создано, занято и свободно
+    соединений и доля занятых от максимума.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        async_pools = [
+            pool for loop_pools in _async_pools.values() for pool in loop_pools.values()
+        ]
+    return {
+        "sync": [_get_usage(pool) for pool in pools],
+        "async": [_get_usage(pool) for pool in async_pools],
+    }
@@ -0,0 +1,192 @@
+from dataclasses import dataclass, field
+import hashlib
+import json
+import logging
+import re
+import threading
+from django.conf import settings
+import redis
+from .models import Step
+from .redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+# Поля шага, необходимые для построения хэндлеров
+STEP_FIELDS = (
+    "id",
+    "title",
+    "scenario_id",
+    "is_active",
+    "is_using_ai",
+    "is_entry_point",
+    "is_fallback",
+    "is_end",
+    "on_state",
+    "result_state",
+    "template",
+    "priority",
+    "message",
+    "handler_data",
+)
+
+
+@dataclass(frozen=True)
+class CompiledScenario:
+    """
+    Скомпилированный сценарий: активные шаги в порядке приоритета
+    и заранее скомпилированные регулярные выражения фильтров.
+    """
+
+    scenario_id: int
+    digest: str
+    steps: tuple = ()
+    patterns: dict = field(default_factory=dict)
+
+
+def compile_scenario(scenario_id, rows: list) -> CompiledScenario:
+    """
+    Компилирует сценарий из данных активных шагов.
+
+    :param scenario_id: id сценария
+    :param rows: список словарей с полями STEP_FIELDS, упорядоченный по приоритету
+    """
+    payload = json.dumps(rows, sort_keys=True, ensure_ascii=False, default=str)
+    patterns = {}
+    for row in rows:
+        regex = (row["handler_data"] or {}).get("filter_regex")
+        if regex and regex not in patterns:
+            patterns[regex] = re.compile(regex)
+    return CompiledScenario(
+        scenario_id=scenario_id,
+        digest=hashlib.sha256(payload.encode()).hexdigest(),
+        steps=tuple(Step(**row) for row in rows),
+        patterns=patterns,
+    )
+
+
+class ScenarioCache:
+    """
+    Кэш скомпилированных сценариев в памяти процесса и в Redis.
+
+    Каждый сценарий имеет номер версии в Redis, который увеличивается при
+    изменении шагов. Версия указывает на хэш содержимого активных шагов,
+    а по хэшу хранятся сами данные шагов, поэтому боты с одинаковым
+    сценарием используют одну запись, а проверка актуальности стоит
+    одного обращения к Redis.
+    """
+
+    def __init__(self):
+        self.redis = get_redis()
+        self._local = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version_key(scenario_id) -> str:
+        return f"bots:scenario:{scenario_id}:version"
+
+    @staticmethod
+    def _digest_key(scenario_id, version) -> str:
+        return f"bots:scenario:{scenario_id}:v{version}"
+
+    @staticmethod
+    def _artifact_key(scenario_id, digest) -> str:
+        return f"bots:scenario:{scenario_id}:steps:{digest}"
+
+    def _load(self, scenario_id) -> CompiledScenario:
+        """Загружает активные шаги сценария из БД и компилирует их."""
+        rows = list(Step.objects.for_scenario(scenario_id).values(*STEP_FIELDS))
+        return compile_scenario(scenario_id, rows)
+
+    def get(self, scenario_id) -> CompiledScenario:
+        """
+        Возвращает скомпилированный сценарий.
+        Если Redis недоступен, сценарий загружается из БД без кэширования.
+        """
+        try:
+            version = int(self.redis.get(self._version_key(scenario_id)) or 0)
+            with self._lock:
+                cached = self._local.get(scenario_id)
+            if cached and cached[0] == version:
+                return cached[1]
+
+            compiled = None
+            digest = self.redis.get(self._digest_key(scenario_id, version))
+            if digest:
+                raw = self.redis.get(self._artifact_key(scenario_id, digest.decode()))
+                if raw:
+                    compiled = compile_scenario(scenario_id, json.loads(raw))
+            if compiled is None:
+                compiled = self._load(scenario_id)
+                rows = [
+                    {name: getattr(step, name) for name in STEP_FIELDS}
+                    for step in compiled.steps
+                ]
+                with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.set(
+                        self._artifact_key(scenario_id, compiled.digest),
+                        json.dumps(rows, ensure_ascii=False, default=str),
+                        ex=settings.SCENARIO_CACHE_TTL,
+                    )
+                    pipe.set(
+                        self._digest_key(scenario_id, version),
+                        compiled.digest,
+                        ex=settings.SCENARIO_CACHE_TTL,
+                    )
+                    pipe.execute()
+            with self._lock:
+                self._local[scenario_id] = (version, compiled)
+            return compiled
+        except redis.RedisError as e:
+            logger.warning(f"Scenario cache unavailable for scenario {scenario_id}: {e}")
+            return self._load(scenario_id)
+
+    def warm(self, steps_by_scenario: dict):
+        """
+        Заполняет кэш уже загруженными из БД шагами нескольких сценариев.
+        Используется при массовом запуске ботов, чтобы не загружать сценарии по одному.
+
+        :param steps_by_scenario: словарь scenario_id -> список активных шагов
+            (объекты Step), упорядоченный по приоритету
+        """
+        scenario_ids = list(steps_by_scenario)
+        if not scenario_ids:
+            return
+        try:
+            versions = self.redis.mget(
+                [self._version_key(scenario_id) for scenario_id in scenario_ids]
+            )
+            with self.redis.pipeline(transaction=False) as pipe:
+                for scenario_id, version in zip(scenario_ids, versions):
+                    rows = [
+                        {name: getattr(step, name) for name in STEP_FIELDS}
+                        for step in steps_by_scenario[scenario_id]
+                    ]
+                    compiled = compile_scenario(scenario_id, rows)
+                    pipe.set(
+                        self._artifact_key(scenario_id, compiled.digest),
+                        json.dumps(rows, ensure_ascii=False, default=str),
+                        ex=settings.SCENARIO_CACHE_TTL,
+                    )
+                    pipe.set(
+                        self._digest_key(scenario_id, int(version or 0)),
+                        compiled.digest,
+                        ex=settings.SCENARIO_CACHE_TTL,
+                    )
+                    with self._lock:
+                        self._local[scenario_id] = (int(version or 0), compiled)
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not warm scenario cache: {e}")
+
+    def invalidate(self, scenario_id):
+        """Помечает сценарий измененным во всех процессах."""
+        with self._lock:
+            self._local.pop(scenario_id, None)
+        try:
+            self.redis.incr(self._version_key(scenario_id))
+        except redis.RedisError as e:
+            logger.warning(f"Could not invalidate scenario {scenario_id} cache: {e}")
+
+
+scenario_cache = ScenarioCache()
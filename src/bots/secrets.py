@@ -0,0 +1,95 @@
+from collections import namedtuple
+import logging
+import threading
+import time
+from django.conf import settings
+from .models import Bot
+
+
+logger = logging.getLogger(__name__)
+
+BotSecrets = namedtuple("BotSecrets", Bot.SECRET_FIELDS)
+
+
+class SecretCache:
+    """
+    Кэш расшифрованных секретов ботов в памяти процесса.
+    Запись действительна BOT_SECRETS_CACHE_TTL секунд и только для той версии
+    бота (updated_at), для которой получена, поэтому изменение бота сразу
+    приводит к повторной загрузке секретов.
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        """
+        :param ttl: время жизни записи, сек.
+        :param max_size: максимум записей в кэше
+        """
+        self.ttl = ttl or settings.BOT_SECRETS_CACHE_TTL
+        self.max_size = max_size or settings.BOT_SECRETS_CACHE_SIZE
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, bot_id, updated_at):
+        entry = self._entries.get(bot_id)
+        if entry and entry[0] == updated_at and entry[1] > time.monotonic():
+            return entry[2]
+        return None
+
+    def _store(self, bot_id, updated_at, secrets: BotSecrets):
+        if len(self._entries) >= self.max_size:
+            now = time.monotonic()
+            self._entries = {
+                key: entry for key, entry in self._entries.items() if entry[1] > now
+            }
+            if len(self._entries) >= self.max_size:
+                self._entries.clear()
+        self._entries[bot_id] = (updated_at, time.monotonic() + self.ttl, secrets)
+
+    def get(self, bot: Bot) -> BotSecrets:
+        """
+        Возвращает секреты бота. Если они уже загружены в объект, используются
+        они, иначе секреты читаются из БД одним запросом.
+        """
+        with self._lock:
+            secrets = self._lookup(bot.pk, bot.updated_at)
+        if secrets is not None:
+            return secrets
+        if set(Bot.SECRET_FIELDS) & bot.get_deferred_fields():
+            return self.get_many([(bot.pk, bot.updated_at)])[bot.pk]
+        secrets = BotSecrets(*(getattr(bot, name) for name in Bot.SECRET_FIELDS))
+        with self._lock:
+            self._store(bot.pk, bot.updated_at, secrets)
+        return secrets
+
+    def get_many(self, bots) -> dict:
+        """
+        Возвращает секреты нескольких ботов, загружая недостающие одним запросом.
+        :param bots: список пар (bot_id, updated_at)
+        :return: словарь bot_id -> BotSecrets
+        """
+        result, missing = {}, {}
+        with self._lock:
+            for bot_id, updated_at in bots:
+                secrets = self._lookup(bot_id, updated_at)
+                if secrets is None:
+                    missing[bot_id] = updated_at
+                else:
+                    result[bot_id] = secrets
+        if missing:
+            rows = Bot.objects.with_secrets().filter(pk__in=missing).values_list(
+                "pk", "updated_at", *Bot.SECRET_FIELDS
+            )
+            with self._lock:
+                for bot_id, updated_at, *values in rows:
+                    secrets = BotSecrets(*values)
+                    self._store(bot_id, updated_at, secrets)
+                    result[bot_id] = secrets
+        return result
+
+    def invalidate(self, bot_id):
+        """Удаляет секреты бота из кэша."""
+        with self._lock:
+            self._entries.pop(bot_id, None)
+
+
+secret_cache = SecretCache()
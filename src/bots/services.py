@@ -1,7 +1,20 @@
-from celery.result import AsyncResult
-import requests
-from .models import Bot
-from . import tasks
+import asyncio
+import json
+from celery import group
+from celery.result import AsyncResult, GroupResult
+from celery.states import FAILURE, PENDING, READY_STATES, SUCCESS
+from celery.utils import uuid
+import time
+import httpx
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from .models import Bot, Step
+from .cluster import worker_registry
+from .liveness import evaluate_heartbeat, read_heartbeats
+from .redis_client import get_redis
+from .secrets import secret_cache
+from . import events, tasks
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,26 +23,119 @@ logger = logging.getLogger(__name__)
 class BotService:
     """Сервис для управления ботами"""
 
+    # Последний результат проверки доступности Celery: (время проверки, результат)
+    _celery_available = (0.0, False)
+
     @staticmethod
     def check_celery_available():
-        """Проверка доступности Celery"""
+        """
+        Проверка доступности Celery по heartbeat воркеров в Redis.
+        Результат кэшируется в процессе на BOT_WORKERS_CHECK_TTL секунд,
+        поэтому серия запросов на запуск не нагружает Redis и воркеры.
+        """
+        checked_at, available = BotService._celery_available
+        if time.monotonic() - checked_at < settings.BOT_WORKERS_CHECK_TTL:
+            return available
         try:
-            import redis
-            from django.conf import settings
-
-            # Проверяем подключение к Redis
-            redis_client = redis.from_url(settings.CELERY_BROKER_URL)
-            redis_client.ping()
-            # Простая проверка подключения к брокеру
-            from celery import current_app
-
-            insp = current_app.control.inspect()
-            if insp.ping():
-                return True
-            return False
+            available = bool(worker_registry.get_live_workers())
         except Exception as e:
             logger.error(f"Celery check failed: {e}")
-            return False
+            available = False
+        BotService._celery_available = (time.monotonic(), available)
+        return available
+
+    @staticmethod
+    def send_control_task(task, bot_id):
+        """
+        Отправляет задачу управления ботом в очередь воркера, владеющего ботом.
+        :param task: Celery-задача, принимающая bot_id
+        :param bot_id: id бота
+        """
+        queue = worker_registry.get_queue_for_bot(bot_id)
+        # Событие публикуется до отправки, чтобы воркер не опередил его своими
+        task_id = uuid()
+        events.publish_event(bot_id, events.QUEUED, operation=task.name, task_id=task_id)
+        return task.apply_async((bot_id,), queue=queue, task_id=task_id)
+
+    @staticmethod
+    def send_control_group(task, bot_ids):
+        """
+        Отправляет задачи управления несколькими ботами одной группой Celery.
+        Каждая задача направляется в очередь воркера, владеющего ботом.
+        :return: GroupResult, сохраненный в backend результатов, или None
+        """
+        bot_ids = list(bot_ids)
+        if not bot_ids:
+            return None
+        queues = worker_registry.get_queues_for_bots(bot_ids)
+        task_ids = {bot_id: uuid() for bot_id in bot_ids}
+        events.publish_events(
+            [
+                {
+                    "bot_id": bot_id,
+                    "state": events.QUEUED,
+                    "operation": task.name,
+                    "task_id": task_ids[bot_id],
+                }
+                for bot_id in bot_ids
+            ]
+        )
+        result = group(
+            task.si(bot_id).set(queue=queues[bot_id], task_id=task_ids[bot_id])
+            for bot_id in bot_ids
+        ).apply_async()
+        result.save()
+        return result
+
+    @staticmethod
+    def control_bots(operation, bot_ids):
+        """
+        Массовое управление ботами.
+        :param operation: start, stop или restart
+        :param bot_ids: список id ботов
+        :return: (id группы, словарь bot_id -> id задачи)
+        """
+        task = {
+            "start": tasks.start_bot,
+            "stop": tasks.stop_bot,
+            "restart": tasks.restart_bot,
+        }[operation]
+        bot_ids = list(bot_ids)
+        result = BotService.send_control_group(task, bot_ids)
+        if result is None:
+            return None, {}
+        return result.id, dict(zip(bot_ids, (child.id for child in result.results)))
+
+    @staticmethod
+    def get_group_status(group_id):
+        """Сводный статус группы задач массового управления"""
+        result = GroupResult.restore(group_id)
+        if result is None:
+            return None
+        # Состояния всех задач читаются из бэкенда результатов одним запросом (MGET),
+        # а не отдельным запросом на каждую задачу
+        backend = result.backend
+        task_ids = [child.id for child in result.results]
+        values = (
+            backend.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+            if task_ids
+            else []
+        )
+        states = [
+            (task_id, backend.decode_result(value)["status"] if value else PENDING)
+            for task_id, value in zip(task_ids, values)
+        ]
+        return {
+            "group_id": group_id,
+            "total": len(states),
+            "completed": sum(state in READY_STATES for _, state in states),
+            "successful": sum(state == SUCCESS for _, state in states),
+            "failed": sum(state == FAILURE for _, state in states),
+            "ready": all(state in READY_STATES for _, state in states),
+            "tasks": [
+                {"task_id": task_id, "status": state} for task_id, state in states
+            ],
+        }
 
     @staticmethod
     def start_bot(bot_id):
@@ -38,7 +144,7 @@ class BotService:
             logger.error("Celery is not available. Cannot start bot.")
             return None
         try:
-            task = tasks.start_bot.delay(bot_id)
+            task = BotService.send_control_task(tasks.start_bot, bot_id)
             logger.info(f"Start task created for bot {bot_id}: {task.id}")
             return task.id
         except Exception as e:
@@ -49,7 +155,7 @@ class BotService:
     def stop_bot(bot_id):
         """Остановить бота"""
         try:
-            task = tasks.stop_bot.delay(bot_id)
+            task = BotService.send_control_task(tasks.stop_bot, bot_id)
             logger.info(f"Stopping bot {bot_id}...")
             return task.id
         except Exception as e:
@@ -60,30 +166,106 @@ class BotService:
     def restart_bot(bot_id):
         """Перезапустить бота"""
         try:
-            task = tasks.restart_bot.delay(bot_id)
+            task = BotService.send_control_task(tasks.restart_bot, bot_id)
             return task.id
         except Exception as e:
             logger.error(f"Error restarting bot {bot_id}: {e}")
             return None
 
+    @staticmethod
+    def reload_bot(bot_id):
+        """Применить изменения сценария без остановки бота"""
+        try:
+            task = BotService.send_control_task(tasks.reload_bot, bot_id)
+            return task.id
+        except Exception as e:
+            logger.error(f"Error reloading bot {bot_id}: {e}")
+            return None
+
+    @staticmethod
+    def get_reload_key(bot_id):
+        return f"bots:reload:{bot_id}"
+
+    @staticmethod
+    def schedule_reload(bot_id):
+        """
+        Отложенная перезагрузка сценария бота. Изменения, сделанные в течение
+        BOT_RELOAD_SETTLE_SECONDS после последнего, объединяются в одну перезагрузку.
+        """
+        settle = settings.BOT_RELOAD_SETTLE_SECONDS
+        try:
+            redis_client = get_redis()
+            # В ключе хранится момент, после которого можно перезагружать бота
+            previous = redis_client.set(
+                BotService.get_reload_key(bot_id),
+                time.time() + settle,
+                ex=max(int(settle * 10), 60),
+                get=True,
+            )
+            if previous is not None:
+                # Перезагрузка уже запланирована, срок лишь сдвинут
+                return None
+            task = tasks.reload_bot_debounced.apply_async((bot_id,), countdown=settle)
+            return task.id
+        except Exception as e:
+            logger.error(f"Error scheduling reload of bot {bot_id}: {e}")
+            return BotService.reload_bot(bot_id)
+
     @staticmethod
     def start_all():
         """Запуск всех активных ботов"""
-        active_bots = Bot.objects.filter(is_active=True)
-        results = {}
-        for bot in active_bots:
-            result = tasks.start_bot.delay(bot.id)
-            results[bot.id] = result.id
-        return results
-    
+        bot_ids = Bot.objects.filter(is_active=True).values_list("id", flat=True)
+        return BotService.control_bots("start", bot_ids)
+
     @staticmethod
     def stop_all():
         """Остановка всех ботов"""
-        running_bots = Bot.objects.filter(is_running=True)
-        results = {}
-        for bot in running_bots:
-            result = tasks.stop_bot.delay(bot.id)
-            results[bot.id] = result.id
+        bot_ids = Bot.objects.filter(is_running=True).values_list("id", flat=True)
+        return BotService.control_bots("stop", bot_ids)
+
+    SUMMARY_CACHE_KEY = "bots:summary"
+
+    @staticmethod
+    def get_summary():
+        """
+        Статистика по ботам и шагам: по одному запросу на таблицу.
+        Результат кэшируется на BOTS_SUMMARY_CACHE_TTL секунд (0 - без кэша),
+        кэш сбрасывается при изменении ботов и шагов.
+        """
+        ttl = settings.BOTS_SUMMARY_CACHE_TTL
+        if ttl:
+            try:
+                summary = cache.get(BotService.SUMMARY_CACHE_KEY)
+                if summary is not None:
+                    return summary
+            except Exception as e:
+                logger.warning(f"Summary cache unavailable: {e}")
+        bots = Bot.objects.get_counts()
+        steps = Step.objects.get_counts()
+        summary = {
+            "total_bots": bots["total"],
+            "active_bots": bots["active"],
+            "running_bots": bots["running"],
+            "stopped_bots": bots["active"] - bots["running"],
+            "inactive_bots": bots["total"] - bots["active"],
+            "total_handlers": steps["total"],
+            "active_handlers": steps["active"],
+            "inactive_handlers": steps["total"] - steps["active"],
+        }
+        if ttl:
+            try:
+                cache.set(BotService.SUMMARY_CACHE_KEY, summary, ttl)
+            except Exception as e:
+                logger.warning(f"Summary cache unavailable: {e}")
+        return summary
+
+    @staticmethod
+    def invalidate_summary():
+        """Сбрасывает кэш статистики."""
+        try:
+            cache.delete(BotService.SUMMARY_CACHE_KEY)
+        except Exception as e:
+            logger.warning(f"Summary cache unavailable: {e}")
 
     @staticmethod
     def get_task_status(task_id):
@@ -102,29 +284,121 @@ class BotService:
 
 
 class BotHealthChecker:
-    """Проверка здоровья ботов"""
+    """
+    Проверка здоровья ботов.
+    Живость запущенных ботов определяется по heartbeat, который они сами
+    публикуют в Redis. Запрос getMe к Telegram API (проверка токена) выполняется
+    параллельно через общий пул HTTP-соединений.
+    Результаты сохраняются в Redis-хэш HEALTH_KEY (bot_id -> JSON).
+    """
+
+    HEALTH_KEY = "bots:health"
+    API_URL = "https://api.telegram.org"
+
+    def __init__(self, concurrency=None, timeout=None):
+        """
+        :param concurrency: максимум одновременных запросов к Telegram
+        :param timeout: таймаут запроса, сек.
+        """
+        self.concurrency = concurrency or settings.BOT_HEALTH_CHECK_CONCURRENCY
+        self.timeout = timeout or settings.BOT_HEALTH_CHECK_TIMEOUT
+
+    async def _check(self, client, semaphore, bot_id, token):
+        """Проверяет одного бота."""
+        if not token:
+            return {"status": "unreachable", "bot_id": bot_id, "error": "No token"}
+        async with semaphore:
+            try:
+                response = await client.get(f"{self.API_URL}/bot{token}/getMe")
+                data = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                return {"status": "unreachable", "bot_id": bot_id, "error": str(e)}
+        if response.status_code == 200 and data.get("ok"):
+            return {"status": "healthy", "bot_id": bot_id}
+        return {"status": "unreachable", "bot_id": bot_id, "error": data}
+
+    async def check_bots(self, bots):
+        """
+        Проверяет ботов параллельно.
+        :param bots: список пар (bot_id, telegram_token)
+        :return: словарь bot_id -> результат проверки
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(
+            max_connections=self.concurrency,
+            max_keepalive_connections=self.concurrency,
+        )
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            results = await asyncio.gather(
+                *(
+                    self._check(client, semaphore, bot_id, token)
+                    for bot_id, token in bots
+                )
+            )
+        return {result["bot_id"]: result for result in results}
+
+    def save_results(self, results):
+        """Сохраняет результаты проверки в Redis одним запросом."""
+        if not results:
+            return
+        checked_at = time.time()
+        try:
+            redis_client = get_redis()
+            with redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(
+                    self.HEALTH_KEY,
+                    mapping={
+                        bot_id: json.dumps(
+                            {**result, "checked_at": checked_at}, default=str
+                        )
+                        for bot_id, result in results.items()
+                    },
+                )
+                pipe.expire(self.HEALTH_KEY, settings.BOT_HEALTH_CHECK_INTERVAL * 3)
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Could not save bots health: {e}")
 
     def check_bot_health(self, bot_id):
         """Проверить здоровье конкретного бота"""
         bot = Bot.objects.get(id=bot_id)
-        token = bot.telegram_token
-        url = f"https://api.telegram.org/bot{token}/getMe"
-        try:
-            response = requests.get(url, timeout=5)
-            if response.status_code == 200 and response.json().get("ok"):
-                return {"status": "healthy", "bot_id": bot_id}
-            else:
-                return {
-                    "status": "unreachable",
-                    "bot_id": bot_id,
-                    "error": response.json(),
-                }
-        except requests.RequestException as e:
-            return {"status": "unreachable", "bot_id": bot_id, "error": str(e)}
+        token = secret_cache.get(bot).telegram_token
+        results = asyncio.run(self.check_bots([(bot.id, token)]))
+        return results[bot.id]
 
     def check_all_bots(self):
-        """Проверить всех ботов"""
-        results = {}
-        for bot in Bot.objects.filter(is_active=True):
-            results[bot.id] = self.check_bot_health(bot.id)
+        """
+        Проверить всех ботов по их heartbeat. Для ботов, которые не публикуют
+        heartbeat, дополнительно проверяется токен запросом getMe: результат
+        сохраняется в поле token, чтобы отличить незапущенного бота от бота
+        с отозванным токеном.
+        """
+        bot_ids = list(Bot.objects.filter(is_active=True).values_list("id", flat=True))
+        now = time.time()
+        heartbeats = read_heartbeats(bot_ids)
+        results = {
+            bot_id: evaluate_heartbeat(bot_id, heartbeat, now)
+            for bot_id, heartbeat in heartbeats.items()
+        }
+        missing = [bot_id for bot_id, heartbeat in heartbeats.items() if not heartbeat]
+        for bot_id, probe in self.probe_bots(missing).items():
+            results[bot_id]["token"] = probe["status"]
+            if "error" in probe:
+                results[bot_id]["error"] = probe["error"]
+        self.save_results(results)
         return results
+
+    def probe_bots(self, bot_ids):
+        """
+        Проверить токены ботов запросом getMe.
+        :param bot_ids: id ботов
+        :return: словарь bot_id -> результат проверки
+        """
+        bot_ids = list(bot_ids)
+        if not bot_ids:
+            return {}
+        secrets = secret_cache.get_many(
+            Bot.objects.filter(id__in=bot_ids).values_list("id", "updated_at")
+        )
+        bots = [(bot_id, secret.telegram_token) for bot_id, secret in secrets.items()]
+        return asyncio.run(self.check_bots(bots))
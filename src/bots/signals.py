@@ -1,10 +1,70 @@
-from celery.signals import worker_ready
+from celery.signals import celeryd_after_setup, worker_ready, worker_shutdown
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cluster import WorkerHeartbeat, get_worker_queue, worker_registry
+from .models import Bot, Scenario, Step
+from .scenario_cache import scenario_cache
+
+
+_worker_heartbeat = None
+
+
+@celeryd_after_setup.connect
+def on_worker_setup(sender, instance, **kwargs):
+    """Регистрирует собственную очередь воркера для задач управления его ботами."""
+    worker_registry.worker_id = sender
+    instance.app.amqp.queues.select_add(get_worker_queue(sender))
 
 
 @worker_ready.connect
 def on_worker_ready(sender, **kwargs):
+    global _worker_heartbeat
     try:
+        from bots.bot_runner import get_running_bot_ids, release_lost_bot
         from bots.tasks import start_all_bots_on_startup
-        start_all_bots_on_startup.delay()
+
+        worker_registry.heartbeat(0)
+        _worker_heartbeat = WorkerHeartbeat(get_running_bot_ids, release_lost_bot)
+        _worker_heartbeat.start()
+        start_all_bots_on_startup.apply_async(
+            queue=get_worker_queue(worker_registry.worker_id)
+        )
     except Exception as e:
         print(e)
+
+
+@worker_shutdown.connect
+def on_worker_shutdown(sender, **kwargs):
+    if _worker_heartbeat:
+        _worker_heartbeat.stop()
+    try:
+        worker_registry.unregister()
+    except Exception as e:
+        print(e)
+
+
+@receiver(post_save, sender=Step)
+@receiver(post_delete, sender=Step)
+def update_active_steps_count(sender, instance, **kwargs):
+    """Пересчитывает количество активных шагов сценария после изменения шага."""
+    Scenario.objects.refresh_active_steps_count(instance.scenario_id)
+
+
+@receiver(post_save, sender=Step)
+@receiver(post_delete, sender=Step)
+def invalidate_scenario_cache(sender, instance, **kwargs):
+    """Сбрасывает кэш скомпилированного сценария после изменения шага."""
+    scenario_id = instance.scenario_id
+    transaction.on_commit(lambda: scenario_cache.invalidate(scenario_id))
+
+
+@receiver(post_save, sender=Bot)
+@receiver(post_delete, sender=Bot)
+@receiver(post_save, sender=Step)
+@receiver(post_delete, sender=Step)
+def invalidate_summary_cache(sender, **kwargs):
+    """Сбрасывает кэш статистики по ботам после изменения бота или шага."""
+    from .services import BotService
+
+    transaction.on_commit(BotService.invalidate_summary)
@@ -1,7 +1,8 @@
+import time
 from celery import shared_task
 from celery.utils.log import get_task_logger
 from .models import Bot
-from .bot_runner import start_bot_task, stop_bot_task, restart_bot_task
+from .bot_runner import start_bot_task, stop_bot_task, restart_bot_task, reload_bot_task
 from django.conf import settings
 
 
@@ -81,6 +82,119 @@ def restart_bot(self, bot_id):
         raise self.retry(countdown=60, exc=e)
 
 
+@shared_task(bind=True, max_retries=3, queue="bot_operations")
+def reload_bot(self, bot_id):
+    """Горячая перезагрузка сценария бота"""
+    try:
+        result = reload_bot_task(bot_id)
+        if result:
+            logger.info(f"Bot {bot_id} reloaded successfully")
+            return True
+        else:
+            logger.error(f"Failed to reload bot {bot_id}")
+            raise self.retry(countdown=60)
+
+    except Exception as e:
+        logger.error(f"Error reloading bot {bot_id}: {e}")
+        raise self.retry(countdown=60, exc=e)
+
+
+# Удаляет ключ, только если его значение не изменилось с момента чтения
+COMPARE_AND_DELETE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+@shared_task(queue="bot_operations")
+def reload_bot_debounced(bot_id):
+    """
+    Перезагрузка сценария после серии изменений шагов.
+    Пока изменения продолжаются, задача откладывает себя до их окончания.
+    """
+    from .redis_client import get_redis
+    from .services import BotService
+
+    redis_client = get_redis()
+    key = BotService.get_reload_key(bot_id)
+    deadline = redis_client.get(key)
+    if deadline is None:
+        return False
+    remaining = float(deadline) - time.time()
+    if remaining > 0:
+        reload_bot_debounced.apply_async((bot_id,), countdown=remaining)
+        return False
+    release = redis_client.register_script(COMPARE_AND_DELETE_SCRIPT)
+    if not release(keys=[key], args=[deadline]):
+        # Срок сдвинуло новое изменение; его задачу schedule_reload не создает
+        reload_bot_debounced.apply_async(
+            (bot_id,), countdown=settings.BOT_RELOAD_SETTLE_SECONDS
+        )
+        return False
+    logger.info(f"Scenario edits settled, reloading bot {bot_id}")
+    return BotService.reload_bot(bot_id) is not None
+
+
+@shared_task(queue="bot_operations")
+def supervise_bots():
+    """
+    Перенос ботов с истекшей арендой (воркер упал или завис) на живые воркеры.
+    Бот размещается на наименее загруженном воркере с учетом уже перенесенных.
+    """
+    from datetime import timedelta
+    from django.utils import timezone
+    from .cluster import get_worker_queue, worker_registry
+    from .redis_client import get_redis
+
+    redis_client = get_redis()
+    lock_key = "bots:supervisor:lock"
+    if not redis_client.set(lock_key, 1, nx=True, ex=settings.BOT_LEASE_TTL):
+        return {'status': 'skipped'}
+    try:
+        # Только что запущенные боты могут еще не успеть взять аренду
+        grace = timezone.now() - timedelta(seconds=settings.BOT_LEASE_TTL)
+        running = dict(
+            Bot.objects.filter(is_active=True, is_running=True).values_list(
+                "id", "last_started"
+            )
+        )
+        placements = worker_registry.get_placements()
+        stale = [bot_id for bot_id in placements if bot_id not in running]
+        candidates = [
+            bot_id
+            for bot_id, last_started in running.items()
+            if bot_id in placements or not last_started or last_started < grace
+        ]
+        expired = worker_registry.get_expired_leases(candidates)
+        for bot_id in worker_registry.get_expired_leases(stale):
+            worker_registry.unassign(bot_id)
+        if not expired:
+            return {'status': 'success', 'moved': 0}
+
+        workers = worker_registry.get_live_workers()
+        if not workers:
+            logger.error(f"No live workers, {len(expired)} bot(s) are not running")
+            Bot.objects.filter(id__in=expired).update(is_running=False)
+            return {'status': 'error', 'moved': 0, 'lost': len(expired)}
+
+        moved = {}
+        for bot_id in expired:
+            worker_id = worker_registry.get_least_loaded(workers)
+            workers[worker_id]["bots"] += 1
+            worker_registry.assign(bot_id, worker_id)
+            start_bot.apply_async((bot_id,), queue=get_worker_queue(worker_id))
+            moved[bot_id] = worker_id
+            logger.warning(
+                f"Lease of bot {bot_id} expired "
+                f"(was on {placements.get(bot_id)}), moving to {worker_id}"
+            )
+        return {'status': 'success', 'moved': len(moved), 'placements': moved}
+    finally:
+        redis_client.delete(lock_key)
+
+
 @shared_task(queue="bot_operations")
 def check_bots_health():
     """Периодическая проверка здоровья ботов"""
@@ -89,42 +203,198 @@ def check_bots_health():
     checker = BotHealthChecker()
     return checker.check_all_bots()
 
-@shared_task(queue="bot_operations")
-def start_all_bots_on_startup():
-    bots = Bot.objects.filter(is_active=True)
+@shared_task(bind=True, queue="bot_operations")
+def start_all_bots_on_startup(self):
+    """
+    Запуск активных ботов, закрепленных за текущим воркером.
+    Боты вместе со сценариями и шагами загружаются одним запросом, запуск идет
+    параллельно (BOT_STARTUP_PARALLELISM), но не чаще BOT_STARTUP_RATE ботов
+    в секунду, чтобы не превышать лимиты Telegram API.
+    Ход запуска доступен в статусе задачи (PROGRESS).
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    import threading
+    from django.db import connection
+    from django.db.models import Prefetch
+    from .bot_runner import running_bots
+    from .cluster import worker_registry
+    from .models import Step
+    from .scenario_cache import scenario_cache
+    from .secrets import secret_cache
+
+    workers = worker_registry.get_live_workers()
+    placements = worker_registry.get_placements()
+    bots = [
+        bot
+        for bot in Bot.objects.select_related("current_scenario")
+        .prefetch_related(
+            Prefetch(
+                "current_scenario__steps",
+                queryset=Step.objects.filter(is_active=True).order_by("priority"),
+            )
+        )
+        .filter(is_active=True)
+        if worker_registry.is_owned_here(bot.id, workers, placements)
+    ]
     if not bots:
-        return {'status': 'success', 'bots_started': 0, 'bots': 0}
-    count = 0
-    for bot in bots:
+        return {
+            'status': 'success',
+            'bots_started': 0,
+            'bots_failed': 0,
+            'bots_skipped': 0,
+            'bots': 0,
+        }
+
+    # Секреты всех ботов расшифровываются заранее одним запросом
+    secret_cache.get_many([(bot.id, bot.updated_at) for bot in bots])
+    scenario_cache.warm(
+        {
+            bot.current_scenario_id: bot.current_scenario.steps.all()
+            for bot in bots
+            if bot.current_scenario_id
+        }
+    )
+
+    interval = 1.0 / settings.BOT_STARTUP_RATE if settings.BOT_STARTUP_RATE else 0
+    lock = threading.Lock()
+    next_start = time.monotonic()
+
+    def start_one(bot):
+        nonlocal next_start
+        with lock:
+            now = time.monotonic()
+            delay = next_start - now
+            next_start = max(next_start, now) + interval
+        if delay > 0:
+            time.sleep(delay)
+        # Снимок размещения мог устареть: бот запускается, только если
+        # аренду удалось взять, иначе им уже управляет другой воркер
+        if not worker_registry.acquire_lease(bot.id):
+            return None
         try:
-            result = start_bot_task(bot.id)
-            if result:
-                count += 1
-            logger.info(f'Bot {bot.id} started')
-        except Exception as e:
-            logger.warning(f'Bot {bot.id} failed to start: {e}')
-    
-        status = 'success' if count == len(bots) else 'error'
-    return {'status': status, 'bots_started': count, 'bots': len(bots)}
+            if not start_bot_task(bot.id, bot=bot):
+                return False
+            runner = running_bots.get(bot.id)
+            return bool(runner and runner.wait_ready(settings.BOT_STARTUP_TIMEOUT))
+        finally:
+            connection.close()
+
+    started = failed = skipped = 0
+    with ThreadPoolExecutor(max_workers=settings.BOT_STARTUP_PARALLELISM) as executor:
+        futures = {executor.submit(start_one, bot): bot for bot in bots}
+        for future in as_completed(futures):
+            bot = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.warning(f'Bot {bot.id} failed to start: {e}')
+                result = False
+            if result is None:
+                skipped += 1
+                logger.info(f'Bot {bot.id} is leased by another worker, skipped')
+            elif result:
+                started += 1
+                logger.info(f'Bot {bot.id} started')
+            else:
+                failed += 1
+                logger.warning(f'Bot {bot.id} failed to start')
+            if self.request.id:
+                self.update_state(
+                    state='PROGRESS',
+                    meta={
+                        'bots_started': started,
+                        'bots_failed': failed,
+                        'bots_skipped': skipped,
+                        'bots': len(bots),
+                    },
+                )
+
+    status = 'success' if not failed else 'error'
+    return {
+        'status': status,
+        'bots_started': started,
+        'bots_failed': failed,
+        'bots_skipped': skipped,
+        'bots': len(bots),
+    }
+
 
 @shared_task(queue="bot_operations")
 def cleanup_old_tasks():
     """
-    Очистка старых завершенных задач из брокера.
+    Очистка старых результатов задач в Redis.
+    Ключи перебираются SCAN-ом порциями по TASK_RESULTS_CLEANUP_BATCH, чтобы не
+    блокировать Redis. Удаляются только результаты без срока жизни, завершенные
+    раньше TASK_RESULTS_MAX_AGE секунд назад; остальные Redis удалит сам
+    (CELERY_RESULT_EXPIRES).
     """
+    import json
+    from datetime import datetime, timedelta, timezone as dt_timezone
+    from .redis_client import get_redis
+
+    started = time.monotonic()
+    threshold = datetime.now(dt_timezone.utc) - timedelta(
+        seconds=settings.TASK_RESULTS_MAX_AGE
+    )
+    batch_size = settings.TASK_RESULTS_CLEANUP_BATCH
+
+    def is_expired(raw):
+        try:
+            date_done = json.loads(raw).get('date_done')
+        except (TypeError, ValueError):
+            return False
+        if not date_done:
+            return False
+        done = datetime.fromisoformat(date_done)
+        if done.tzinfo is None:
+            done = done.replace(tzinfo=dt_timezone.utc)
+        return done < threshold
+
     try:
-        import redis
-        
-        r = redis.Redis.from_url(settings.CELERY_BROKER_URL)
-        count = 0
-        
-        old_keys = r.keys('celery-task-meta-*')
-        if old_keys:
-            count += r.delete(*old_keys)
-
-        logger.info(f"Очищено задач: {count}")
-        return {'cleaned': count, 'status': 'success'}
-        
+        r = get_redis(settings.CELERY_RESULT_BACKEND)
+        scanned = count = 0
+        batch = []
+
+        def flush(keys):
+            with r.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.ttl(key)
+                    pipe.get(key)
+                replies = pipe.execute()
+            expired = [
+                key
+                for key, ttl, raw in zip(keys, replies[::2], replies[1::2])
+                if ttl == -1 and is_expired(raw)
+            ]
+            if not expired:
+                return 0
+            with r.pipeline(transaction=False) as pipe:
+                for key in expired:
+                    pipe.unlink(key)
+                return sum(pipe.execute())
+
+        for key in r.scan_iter(match='celery-task-meta-*', count=batch_size):
+            scanned += 1
+            batch.append(key)
+            if len(batch) >= batch_size:
+                count += flush(batch)
+                batch = []
+        if batch:
+            count += flush(batch)
+
+        elapsed = time.monotonic() - started
+        rate = scanned / elapsed if elapsed else scanned
+        logger.info(
+            f"Очищено задач: {count} из {scanned} за {elapsed:.2f} с ({rate:.0f} ключей/с)"
+        )
+        return {
+            'cleaned': count,
+            'scanned': scanned,
+            'elapsed': round(elapsed, 3),
+            'keys_per_second': round(rate),
+            'status': 'success',
+        }
+
     except Exception as e:
         logger.error(f"Ошибка очистки задач: {e}")
         return {'status': 'error', 'error': str(e)}
@@ -1,8 +1,15 @@
 # from django.test import TestCase
 
 # Create your tests here.
+import asyncio
+from unittest import mock
+import fakeredis
 import redis
 from django.conf import settings
+from django.test import SimpleTestCase
+from .cluster import WorkerRegistry
+from .history import RedisHistoryStore
+from .tasks import COMPARE_AND_DELETE_SCRIPT
 
 def test_redis_connection():
     try:
@@ -12,4 +19,109 @@ def test_redis_connection():
         return True
     except Exception as e:
         print(f"❌ Redis connection failed: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+class TrimHeadScriptTest(SimpleTestCase):
+    """Сжатие начала истории чата в Redis (RedisHistoryStore.TRIM_HEAD_SCRIPT)."""
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        patcher = mock.patch(
+            "bots.history.get_async_redis",
+            lambda url=None: fakeredis.FakeAsyncRedis(server=server),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = RedisHistoryStore(bot_id=1, max_messages=10)
+        self.messages = [{"role": "user", "content": str(i)} for i in range(3)]
+        self.summary = {"role": "system", "content": "summary"}
+
+    def run_async(self, coro):
+        return asyncio.run(coro)
+
+    def test_compact_replaces_head(self):
+        async def scenario():
+            await self.store.append(1, *self.messages)
+            compacted = await self.store.compact(1, self.messages[:2], self.summary)
+            return compacted, await self.store.get(1)
+
+        compacted, history = self.run_async(scenario())
+        self.assertTrue(compacted)
+        self.assertEqual(history, [self.summary, self.messages[2]])
+
+    def test_compact_skips_changed_head(self):
+        async def scenario():
+            await self.store.append(1, *self.messages)
+            # Начало истории изменилось после чтения
+            await self.store.compact(1, self.messages[:1], self.summary)
+            compacted = await self.store.compact(1, self.messages[:2], self.summary)
+            return compacted, await self.store.get(1)
+
+        compacted, history = self.run_async(scenario())
+        self.assertFalse(compacted)
+        self.assertEqual(history, [self.summary, *self.messages[1:]])
+
+    def test_compact_skips_short_history(self):
+        async def scenario():
+            await self.store.append(1, self.messages[0])
+            return await self.store.compact(1, self.messages[:2], self.summary)
+
+        self.assertFalse(self.run_async(scenario()))
+
+
+class LeaseScriptTest(SimpleTestCase):
+    """Аренда ботов воркерами (WorkerRegistry.RENEW_LEASE_SCRIPT)."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch("bots.cluster.get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.first = WorkerRegistry()
+        self.first.worker_id = "first"
+        self.second = WorkerRegistry()
+        self.second.worker_id = "second"
+
+    def test_acquire_lease(self):
+        self.assertTrue(self.first.acquire_lease(1))
+        self.assertTrue(self.first.acquire_lease(1))
+        self.assertFalse(self.second.acquire_lease(1))
+        self.assertEqual(self.redis.get(WorkerRegistry.get_lease_key(1)), b"first")
+
+    def test_acquire_lease_assigned_to_other_worker(self):
+        self.first.assign(1, "second")
+        self.assertFalse(self.first.acquire_lease(1))
+        self.assertTrue(self.second.acquire_lease(1))
+
+    def test_renew_leases(self):
+        self.first.set_placement(1)
+        self.second.set_placement(2)
+        self.assertEqual(self.first.renew_leases([1, 2, 3]), [2])
+        self.assertEqual(self.redis.get(WorkerRegistry.get_lease_key(3)), b"first")
+
+    def test_clear_placement_keeps_other_lease(self):
+        self.first.set_placement(1)
+        # Аренда истекла, и бота уже взял другой воркер
+        self.redis.set(WorkerRegistry.get_lease_key(1), "second")
+        self.first.clear_placement(1)
+        self.assertIsNone(self.first.get_placement(1))
+        self.assertEqual(self.redis.get(WorkerRegistry.get_lease_key(1)), b"second")
+
+
+class CompareAndDeleteScriptTest(SimpleTestCase):
+    """Снятие срока отложенной перезагрузки бота (COMPARE_AND_DELETE_SCRIPT)."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.release = self.redis.register_script(COMPARE_AND_DELETE_SCRIPT)
+
+    def test_deletes_unchanged_key(self):
+        self.redis.set("deadline", "1.5")
+        self.assertEqual(self.release(keys=["deadline"], args=["1.5"]), 1)
+        self.assertFalse(self.redis.exists("deadline"))
+
+    def test_keeps_changed_key(self):
+        self.redis.set("deadline", "2.5")
+        self.assertEqual(self.release(keys=["deadline"], args=["1.5"]), 0)
+        self.assertEqual(self.redis.get("deadline"), b"2.5")
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import uuid
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotFound
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from telegram import Update
+from .redis_client import close_async_redis, get_async_redis, get_redis
+
+
+logger = logging.getLogger(__name__)
+
+# Максимум необработанных обновлений, хранимых для одного бота
+WEBHOOK_QUEUE_LIMIT = 1000
+# Время жизни очереди обновлений остановленного бота, сек.
+WEBHOOK_QUEUE_TTL = 24 * 3600
+
+
+def _sign(purpose: str, bot_id) -> str:
+    return hmac.new(
+        settings.SECRET_KEY.encode(),
+        f"{purpose}:{bot_id}".encode(),
+        hashlib.sha256,
+    ).hexdigest()
+
+
+def get_webhook_path_token(bot_id) -> str:
+    """Секретная часть пути webhook бота."""
+    return _sign("webhook-path", bot_id)[:32]
+
+
+def get_webhook_secret_token(bot_id) -> str:
+    """Секрет, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token."""
+    return _sign("webhook-secret", bot_id)
+
+
+def get_webhook_url(bot_id) -> str:
+    """Публичный адрес webhook бота."""
+    base_url = settings.TELEGRAM_WEBHOOK_URL.rstrip("/")
+    return f"{base_url}/telegram/webhook/{bot_id}/{get_webhook_path_token(bot_id)}/"
+
+
+def get_updates_key(bot_id) -> str:
+    """Ключ Redis-очереди входящих обновлений бота."""
+    return f"bots:webhook:{bot_id}"
+
+
+@csrf_exempt
+@require_POST
+async def telegram_webhook(request, bot_id, path_token):
+    """
+    Единая точка приема обновлений Telegram для всех ботов.
+    Проверяет секреты бота и передает обновление в очередь воркера, на котором он запущен.
+    """
+    if not hmac.compare_digest(path_token, get_webhook_path_token(bot_id)):
+        return HttpResponseNotFound()
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret, get_webhook_secret_token(bot_id)):
+        logger.warning(f"Webhook for bot {bot_id} called with invalid secret token")
+        return HttpResponseForbidden()
+    try:
+        json.loads(request.body)
+    except ValueError:
+        return HttpResponse(status=400)
+
+    key = get_updates_key(bot_id)
+    if not isinstance(request, ASGIRequest):
+        # Под WSGI у каждого запроса свой временный event loop, поэтому обновление
+        # записывается через синхронный пул процесса
+        with get_redis().pipeline(transaction=True) as pipe:
+            pipe.rpush(key, request.body)
+            pipe.ltrim(key, -WEBHOOK_QUEUE_LIMIT, -1)
+            pipe.expire(key, WEBHOOK_QUEUE_TTL)
+            pipe.execute()
+        return HttpResponse()
+    async with get_async_redis().pipeline(transaction=True) as pipe:
+        pipe.rpush(key, request.body)
+        pipe.ltrim(key, -WEBHOOK_QUEUE_LIMIT, -1)
+        pipe.expire(key, WEBHOOK_QUEUE_TTL)
+        await pipe.execute()
+    return HttpResponse()
+
+
+class WebhookDispatcher:
+    """
+    Передает обновления, принятые webhook-ом, в очереди приложений ботов процесса.
+    Один поток на процесс читает очереди всех зарегистрированных ботов одним
+    BLPOP, поэтому вместо соединения Redis на каждого бота занято одно.
+    Обновление передается в event loop бота, где оно разбирается и ставится
+    в очередь приложения.
+    """
+
+    # Время ожидания BLPOP, сек. (меньше REDIS_SOCKET_TIMEOUT)
+    BLOCK_TIMEOUT = 5
+
+    def __init__(self):
+        self._bots = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loop = None
+        self._ready = threading.Event()
+        # Элемент в этом списке прерывает BLPOP, чтобы обновить набор очередей
+        self._wake_key = f"bots:webhook:wake:{uuid.uuid4().hex}"
+
+    def register(self, bot_id, application, on_poll=None):
+        """
+        Начинает передачу обновлений бота. Вызывается из event loop бота.
+        :param application: telegram.ext.Application бота
+        :param on_poll: функция, вызываемая после каждого цикла чтения очередей
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._bots[get_updates_key(bot_id)] = (bot_id, application, loop, on_poll)
+            if self._thread is None or not self._thread.is_alive():
+                self._ready.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="WebhookDispatcher", daemon=True
+                )
+                self._thread.start()
+        self._ready.wait(timeout=5.0)
+        self._wake()
+
+    def unregister(self, bot_id):
+        """Прекращает передачу обновлений бота."""
+        with self._lock:
+            self._bots.pop(get_updates_key(bot_id), None)
+        self._wake()
+
+    def _wake(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._push_wake(), self._loop)
+
+    async def _push_wake(self):
+        try:
+            redis_client = get_async_redis()
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.rpush(self._wake_key, 1)
+                pipe.expire(self._wake_key, self.BLOCK_TIMEOUT * 2)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not wake webhook dispatcher: {e}")
+
+    def _run(self):
+        """Рабочая функция потока диспетчера."""
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ready.set()
+        try:
+            self._loop.run_until_complete(self._consume())
+        except Exception as e:
+            logger.error(f"Webhook dispatcher stopped: {e}", exc_info=True)
+        finally:
+            self._loop.run_until_complete(close_async_redis())
+            self._loop.close()
+            self._loop = None
+
+    async def _consume(self):
+        redis_client = get_async_redis()
+        shift = 0
+        while True:
+            with self._lock:
+                bots = dict(self._bots)
+            # Очереди обходятся по кругу, чтобы занятый бот не задерживал остальных
+            keys = list(bots)
+            shift = (shift + 1) % (len(keys) or 1)
+            keys = [self._wake_key] + keys[shift:] + keys[:shift]
+            try:
+                item = await redis_client.blpop(keys, timeout=self.BLOCK_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Error reading webhook updates: {e}")
+                await asyncio.sleep(1)
+                continue
+            for _, _, _, on_poll in bots.values():
+                if on_poll:
+                    on_poll()
+            if not item:
+                continue
+            key, raw = item[0].decode(), item[1]
+            if key == self._wake_key:
+                continue
+            with self._lock:
+                entry = self._bots.get(key)
+            if entry is None:
+                # Бот остановлен, пока шло чтение: возвращаем обновление в очередь
+                await redis_client.lpush(key, raw)
+                continue
+            bot_id, application, loop, _ = entry
+            try:
+                loop.call_soon_threadsafe(self._deliver, bot_id, application, raw)
+            except RuntimeError:
+                await redis_client.lpush(key, raw)
+
+    @staticmethod
+    def _deliver(bot_id, application, raw):
+        """Разбирает обновление и ставит его в очередь приложения (в loop бота)."""
+        try:
+            update = Update.de_json(json.loads(raw), application.bot)
+        except Exception as e:
+            logger.error(f"Invalid webhook update for bot {bot_id}: {e}")
+            return
+        application.update_queue.put_nowait(update)
+
+
+webhook_dispatcher = WebhookDispatcher()
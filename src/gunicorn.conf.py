@@ -1,9 +1,22 @@
+import os
+
+# Профиль запуска: sync - WSGI-воркеры (bot_constructor.wsgi),
+# asgi - асинхронные воркеры uvicorn (bot_constructor.asgi), которые не блокируются
+# медленными запросами и нужны для потока событий ботов (server-sent events).
+profile = os.environ.get("GUNICORN_PROFILE", "sync")
+
 bind = "0.0.0.0:8000"
-workers = 2
-worker_class = "sync"
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+if profile == "asgi":
+    wsgi_app = "bot_constructor.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+else:
+    wsgi_app = "bot_constructor.wsgi:application"
+    worker_class = "sync"
+    timeout = int(os.environ.get("GUNICORN_TIMEOUT", 300))
 worker_connections = 1000
-timeout = 300
-graceful_timeout = 300
+graceful_timeout = timeout
 keepalive = 5
 max_requests = 1000
 max_requests_jitter = 100
@@ -12,4 +25,4 @@ preload_app = True
 # Логирование
 accesslog = "-"
 errorlog = "-"
-loglevel = "info"
\ No newline at end of file
+loglevel = "info"